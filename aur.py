@@ -0,0 +1,224 @@
+import subprocess, threading, hashlib, shutil, json, os
+
+from pkgcache import split_pkgfile
+from syncdb import dep_name
+
+
+# Build cache for AUR packages (paru included). A package is only built again
+# when its key changes: the AUR git commit of its PKGBUILD, the checksums of
+# its sources and the versions of its repo dependencies. Built packages live in a host-side local repo, so later
+# installs just `pacman -U` them.
+
+AUR_URL = "https://aur.archlinux.org"
+REPO_NAME = "cosmic-aur"
+# Every concurrent build gets about this many cores and this much memory
+BUILD_CORES = 4
+BUILD_MEMORY = 2 * 1024 ** 3
+
+CHECKSUMS = ("cksums", "md5sums", "sha1sums", "sha224sums", "sha256sums", "sha384sums", "sha512sums", "b2sums")
+
+
+def read_srcinfo(path: str):
+    """Every key of a .SRCINFO with all its values (pkgbase and split packages together)."""
+    fields = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                key, sep, value = line.strip().partition(" = ")
+                if sep:
+                    fields.setdefault(key, []).append(value)
+    except OSError:
+        pass
+    return fields
+
+
+def git_head(repo: str):
+    """The commit a clone is at, read straight from .git (None if it isn't one)."""
+    git = os.path.join(repo, ".git")
+    try:
+        with open(os.path.join(git, "HEAD"), "r") as f:
+            head = f.read().strip()
+        if not head.startswith("ref: "):
+            return head
+        ref = head[len("ref: "):]
+        if os.path.isfile(os.path.join(git, ref)):
+            with open(os.path.join(git, ref), "r") as f:
+                return f.read().strip()
+        with open(os.path.join(git, "packed-refs"), "r") as f:
+            for line in f:
+                if line.rstrip().endswith(f" {ref}"):
+                    return line.split()[0]
+    except OSError:
+        pass
+    return None
+
+
+def build_key(head: str, srcinfo: dict, index=None):
+    """Cache key of a package, or None if it can't be cached.
+
+    Besides the PKGBUILD's commit and the source checksums, the key holds the
+    versions `index` (the target's sync databases) has of the repo packages it
+    depends on, so a soname bump in, say, pacman rebuilds paru against the new
+    libalpm. Without an index those versions are unknown and nothing is cached.
+    Sources with a SKIP checksum (git and other VCS sources) can change without
+    the PKGBUILD changing, so those packages are built every time too.
+    """
+    if not head or index is None:
+        return None
+    sums = []
+    for key in sorted(srcinfo):
+        # 'sha256sums' and its per-architecture 'sha256sums_x86_64'
+        if key.split("_")[0] in CHECKSUMS:
+            if "SKIP" in srcinfo[key]:
+                return None
+            sums.append(f"{key}={' '.join(srcinfo[key])}")
+    # AUR dependencies aren't in the index, chain_keys folds in their keys
+    deps = [index.lookup(dep) for dep in repo_depends(srcinfo)]
+    versions = sorted({f"{pkg.name}={pkg.version}" for pkg in deps if pkg is not None})
+    return hashlib.sha256("\n".join([head] + sums + versions).encode()).hexdigest()
+
+
+def repo_depends(srcinfo: dict):
+    """Names of everything needed to build and run a package (checkdepends aside)."""
+    deps = []
+    for key, values in srcinfo.items():
+        if key.split("_")[0] in ("depends", "makedepends"):
+            deps += [dep_name(value) for value in values]
+    return list(dict.fromkeys(deps))
+
+
+def provided_names(srcinfo: dict):
+    """What a package base satisfies as a dependency: its packages and their provides."""
+    return srcinfo.get('pkgname', []) + [dep_name(name) for name in srcinfo.get('provides', [])]
+
+
+def build_graph(srcinfos: dict):
+    """{pkgbase: the other package bases it needs built (and installed) first}."""
+    owner = {}
+    for pkgbase, srcinfo in srcinfos.items():
+        for name in [pkgbase] + provided_names(srcinfo):
+            owner.setdefault(name, pkgbase)
+    graph = {}
+    for pkgbase, srcinfo in srcinfos.items():
+        needs = [owner[dep] for dep in repo_depends(srcinfo) if dep in owner]
+        graph[pkgbase] = [dep for dep in dict.fromkeys(needs) if dep != pkgbase]
+    return graph
+
+
+def build_order(graph: dict):
+    """Package bases with every one after the ones it needs."""
+    order, state = [], {}
+
+    def visit(pkgbase, path):
+        if state.get(pkgbase) == "done":
+            return
+        if state.get(pkgbase) == "visiting":
+            raise ValueError(f"AUR packages depend on each other in a loop: {' -> '.join(path + [pkgbase])}")
+        state[pkgbase] = "visiting"
+        for dep in graph[pkgbase]:
+            visit(dep, path + [pkgbase])
+        state[pkgbase] = "done"
+        order.append(pkgbase)
+
+    for pkgbase in graph:
+        visit(pkgbase, [])
+    return order
+
+
+def chain_keys(keys: dict, graph: dict, order: list[str]):
+    """Fold the keys of the AUR packages each one needs into its own key.
+
+    A package built against another AUR package is rebuilt when that one is,
+    and isn't cached when that one can't be.
+    """
+    chained = {}
+    for pkgbase in order:
+        deps = [chained[dep] for dep in graph[pkgbase]]
+        if keys[pkgbase] is None or None in deps:
+            chained[pkgbase] = None
+        else:
+            chained[pkgbase] = hashlib.sha256("\n".join([keys[pkgbase]] + sorted(deps)).encode()).hexdigest()
+    return chained
+
+
+def mem_available():
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+
+
+def build_jobs(cpus: int = None, memory: int = None):
+    """How many packages to build at once, so none of them runs short of cores or memory."""
+    cpus = cpus or os.cpu_count() or 1
+    memory = memory or mem_available()
+    return max(1, min(cpus // BUILD_CORES, memory // BUILD_MEMORY))
+
+
+def makeflags(jobs: int, cpus: int = None):
+    # The cores are shared out between the builds running side by side
+    cpus = cpus or os.cpu_count() or 1
+    return f"-j{max(1, cpus // jobs)}"
+
+
+class AurCache:
+    """A host directory of built AUR packages.
+
+    The package files sit next to a `cosmic-aur` repo database (when repo-add
+    is around) and `keys.json`, which maps a build key to its files. The AUR
+    clones are kept in `src/` and only pulled on later installs.
+    """
+
+    def __init__(self, location: str):
+        if location.startswith("file://"):
+            location = location[len("file://"):]
+        self.path = os.path.abspath(location)
+        self.index_file = os.path.join(self.path, "keys.json")
+        try:
+            with open(self.index_file, "r") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+        # Builds finishing at the same time store their packages one by one
+        self.lock = threading.Lock()
+
+    def source_dir(self, pkgbase: str):
+        return os.path.join(self.path, "src", pkgbase)
+
+    def lookup(self, key: str):
+        """Paths of the packages built for `key`, or None if they aren't all there."""
+        if key is None or key not in self.index:
+            return None
+        paths = [os.path.join(self.path, f) for f in self.index[key]]
+        return paths if all(os.path.isfile(path) for path in paths) else None
+
+    def store(self, key: str, files: list[str], run=subprocess.run):
+        with self.lock:
+            os.makedirs(self.path, exist_ok=True)
+            names = []
+            for path in files:
+                name = os.path.basename(path)
+                shutil.copy2(path, os.path.join(self.path, name))
+                names.append(name)
+            self.index[key] = names
+
+            # Write-then-rename, so an interrupted install can't leave a torn index
+            tmp = self.index_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.index, f, indent=2)
+            os.replace(tmp, self.index_file)
+
+            # Older versions stay in the repo's directory, other keys may still use them
+            if shutil.which("repo-add"):
+                db = os.path.join(self.path, f"{REPO_NAME}.db.tar.gz")
+                run(["repo-add", "-q", db, *[os.path.join(self.path, name) for name in names]], check=False)
+            return [os.path.join(self.path, name) for name in names]
+
+
+def installable(paths: list[str]):
+    # makepkg also builds -debug packages when the debug option is on
+    return [path for path in paths if not (split_pkgfile(os.path.basename(path)) or ("",))[0].endswith("-debug")]
@@ -0,0 +1,203 @@
+"""GUI performance benchmarks for main.py, run offscreen with fake system tools.
+
+    python3 bench/bench_gui.py                  # run and compare with bench/baseline.json
+    python3 bench/bench_gui.py --save-baseline  # store this machine's numbers as the baseline
+"""
+import subprocess, argparse, json, time, sys, os
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKEBIN = os.path.join(REPO, "bench", "fakebin")
+BASELINE = os.path.join(REPO, "bench", "baseline.json")
+
+# Offscreen Qt, and the fake lsblk/gparted in front of the real ones
+os.environ["QT_QPA_PLATFORM"] = "offscreen"
+os.environ["PATH"] = FAKEBIN + os.pathsep + os.environ.get("PATH", "")
+sys.path.insert(0, REPO)
+os.chdir(REPO)
+
+# Child process for the cold start benchmark: time from interpreter start to the first paint
+COLD_START = r"""
+import time
+t0 = time.perf_counter()
+import sys
+sys.path.insert(0, sys.argv[1])
+import main
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QObject, QEvent
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            print(time.perf_counter() - t0, flush=True)
+            app.exit(0)
+        return False
+
+app = QApplication(sys.argv)
+win = main.InstallerWindow()
+watch = FirstPaint()
+win.centralWidget().installEventFilter(watch)
+win.show()
+app.exec()
+"""
+
+
+def percentiles(samples: list[float]):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {'p50': pick(0.50), 'p90': pick(0.90), 'p99': pick(0.99), 'max': samples[-1], 'n': len(samples)}
+
+
+def bench_cold_start(runs: int):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", COLD_START, REPO], capture_output=True, text=True, cwd=REPO, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def bench_transitions(app, win, cycles: int):
+    # Pages 0..6; go_next on the summary page would open the confirmation dialog
+    forward, backward = [], []
+    for _ in range(cycles):
+        win.pages.setCurrentIndex(0)
+        for _ in range(6):
+            t = time.perf_counter()
+            win.go_next()
+            app.processEvents()
+            forward.append(time.perf_counter() - t)
+        for _ in range(6):
+            t = time.perf_counter()
+            win.go_back()
+            app.processEvents()
+            backward.append(time.perf_counter() - t)
+    return forward, backward
+
+
+def bench_keystrokes(app, win, strokes: int):
+    from PyQt6.QtTest import QTest
+    from PyQt6.QtCore import Qt
+
+    win.pages.setCurrentIndex(4)
+    app.processEvents()
+    samples = []
+    for field in (win.user_name, win.user_pass, win.root_pass):
+        field.clear()
+        for i in range(strokes):
+            key = "abcdefgh"[i % 8]
+            t = time.perf_counter()
+            QTest.keyClick(field, key)
+            samples.append(time.perf_counter() - t)
+            if i % 32 == 31:
+                QTest.keyClick(field, Qt.Key.Key_Backspace)
+    return samples
+
+
+def bench_log(app, win, rate: int, seconds: float):
+    """Feed append_log at `rate` lines/s in 100 ms batches (like the install thread's
+    LogPump) while a 16 ms timer measures how late the event loop gets to it."""
+    from PyQt6.QtCore import QTimer, QEventLoop
+
+    win.pages.setCurrentIndex(7)
+    win.log_view.clear()
+    app.processEvents()
+
+    batch = max(1, rate // 10)
+    appends, lateness = [], []
+    sent = [0]
+    line = "    [packages] (123/456) installing some-package-name                 [######-------] 42%"
+    text = "\n".join([line] * batch)
+
+    def feed():
+        t = time.perf_counter()
+        win.append_log(text)
+        appends.append(time.perf_counter() - t)
+        sent[0] += batch
+
+    last = [time.perf_counter()]
+
+    def probe():
+        now = time.perf_counter()
+        lateness.append(max(0.0, now - last[0] - 0.016))
+        last[0] = now
+
+    feeder, prober = QTimer(), QTimer()
+    feeder.setInterval(100)
+    prober.setInterval(16)
+    feeder.timeout.connect(feed)
+    prober.timeout.connect(probe)
+    loop = QEventLoop()
+    QTimer.singleShot(int(seconds * 1000), loop.quit)
+
+    start = time.perf_counter()
+    feeder.start()
+    prober.start()
+    loop.exec()
+    feeder.stop()
+    prober.stop()
+    elapsed = time.perf_counter() - start
+    win.log_view.flush()
+    return appends, lateness, sent[0] / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="cold start runs")
+    parser.add_argument("--seconds", type=float, default=2.0, help="duration of each log throughput run")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown before failing")
+    args = parser.parse_args()
+
+    from PyQt6.QtWidgets import QApplication
+    import main as installer
+
+    results = {}
+    results['cold_start'] = percentiles(bench_cold_start(args.runs))
+
+    app = QApplication(sys.argv)
+    win = installer.InstallerWindow()
+    win.show()
+    app.processEvents()
+
+    forward, backward = bench_transitions(app, win, 20)
+    results['go_next'] = percentiles(forward)
+    results['go_back'] = percentiles(backward)
+    results['keystroke'] = percentiles(bench_keystrokes(app, win, 200))
+    for rate in (1000, 10000, 100000):
+        appends, lateness, achieved = bench_log(app, win, rate, args.seconds)
+        results[f'append_log_{rate}'] = percentiles(appends)
+        results[f'loop_lag_{rate}'] = percentiles(lateness)
+        results[f'loop_lag_{rate}']['lines_per_s'] = achieved
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'Benchmark':<22} {'p50':>10} {'p90':>10} {'p99':>10} {'max':>10} {'baseline p50':>13}")
+    print("-" * 79)
+    for name, stats in results.items():
+        ms = lambda v: f"{v * 1000:.3f}ms"
+        base = baseline.get(name, {}).get('p50')
+        mark = ""
+        if base is not None and stats['p50'] > base * (1 + args.tolerance):
+            mark = "  REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<22} {ms(stats['p50']):>10} {ms(stats['p90']):>10} {ms(stats['p99']):>10} {ms(stats['max']):>10} "
+            f"{ms(base) if base is not None else '-':>13}{mark}"
+        )
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Password hashing benchmark: pwhash against the system crypt(3).
+
+    python3 bench/bench_pwhash.py
+    python3 bench/bench_pwhash.py --rounds 20000 --target 0.5
+"""
+import argparse, time, sys, os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pwhash
+
+
+def timed(fn, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return min(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=10000, help="SHA-512-crypt rounds to time")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--target", type=float, default=pwhash.HASH_TIME, help="calibration target (seconds)")
+    args = parser.parse_args()
+
+    lib = pwhash.libcrypt()
+    if lib is None:
+        print("No system libcrypt, only timing the pure Python implementation")
+
+    salt, password = pwhash.gen_salt(), "correct horse battery staple"
+    setting = f"$6$rounds={args.rounds}${salt}$"
+
+    print(f"SHA-512-crypt, {args.rounds} rounds (best of {args.repeat}):")
+    py_time, py_hash = timed(lambda: pwhash.sha512_crypt(password, salt, args.rounds), args.repeat)
+    print(f"  pure Python  {py_time * 1000:9.1f} ms  {args.rounds / py_time:12,.0f} rounds/s")
+    if lib is not None:
+        c_time, c_hash = timed(lambda: lib.crypt(password, setting), args.repeat)
+        print(f"  libcrypt     {c_time * 1000:9.1f} ms  {args.rounds / c_time:12,.0f} rounds/s  ({py_time / c_time:.1f}x faster)")
+        print(f"  same hash:   {py_hash == c_hash}")
+        if py_hash != c_hash:
+            return 1
+
+    if lib is not None:
+        print("\nyescrypt (best of {}):".format(args.repeat))
+        for cost in range(1, pwhash.YESCRYPT_MAX_COST + 1):
+            try:
+                y_time, _ = timed(lambda: lib.crypt(password, lib.gensalt("$y$", cost)), args.repeat)
+            except ValueError:
+                print("  not supported by this libcrypt")
+                break
+            print(f"  cost {cost:2}      {y_time * 1000:9.1f} ms")
+
+    print(f"\nCalibrated for {args.target * 1000:.0f} ms:")
+    for scheme in ("yescrypt", "sha512"):
+        hasher = pwhash.Hasher(scheme, args.target)
+        cost = hasher.calibrate()
+        took, hashed = timed(lambda: hasher.hash(password), 1)
+        print(f"  {scheme:<9} -> {hasher.scheme:<9} cost {cost:<10} {took * 1000:9.1f} ms  {hashed[:hashed.rindex('$')]}$...")
+        if lib is not None and lib.crypt(password, hashed) != hashed:
+            print("  system crypt doesn't verify it!")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import subprocess, json, os
+
+
+SYS_BLOCK = "/sys/class/block"
+BY_UUID = "/dev/disk/by-uuid"
+LSBLK_COLUMNS = "NAME,SIZE,TYPE,FSTYPE,UUID,MOUNTPOINT"
+
+
+def human_size(size: int):
+    for unit in ("B", "K", "M", "G", "T"):
+        if size < 1024 or unit == "T":
+            return f"{size:.0f}{unit}" if unit == "B" or size >= 10 else f"{size:.1f}{unit}"
+        size /= 1024
+
+
+class BlockDevice:
+    def __init__(self, name: str, size: int, kind: str, fstype: str = None, uuid: str = None, mountpoint: str = None):
+        self.name = name
+        self.size = size
+        self.kind = kind
+        self.fstype = fstype
+        self.uuid = uuid
+        self.mountpoint = mountpoint
+
+    @property
+    def path(self):
+        return f"/dev/{self.name}"
+
+    def label(self):
+        # The device path always comes first; the installer splits it off
+        extra = ", ".join(x for x in (self.fstype, f"on {self.mountpoint}" if self.mountpoint else None) if x)
+        return f"{self.path} ({human_size(self.size)}{', ' + extra if extra else ''})"
+
+    def __eq__(self, other):
+        return isinstance(other, BlockDevice) and vars(self) == vars(other)
+
+
+def partition_names():
+    """Names of all partitions, straight from sysfs (no process spawned)."""
+    try:
+        return {name for name in os.listdir(SYS_BLOCK) if os.path.exists(f"{SYS_BLOCK}/{name}/partition")}
+    except OSError:
+        return set()
+
+
+def uuid_map():
+    """Device name -> filesystem UUID, from the udev by-uuid symlinks."""
+    uuids = {}
+    try:
+        for uuid in os.listdir(BY_UUID):
+            uuids[os.path.basename(os.path.realpath(f"{BY_UUID}/{uuid}"))] = uuid
+    except OSError:
+        pass
+    return uuids
+
+
+def size_map(names):
+    """Device name -> size in bytes, from sysfs (which counts 512-byte sectors)."""
+    sizes = {}
+    for name in names:
+        try:
+            with open(f"{SYS_BLOCK}/{name}/size", "r") as f:
+                sizes[name] = int(f.read()) * 512
+        except (OSError, ValueError):
+            pass
+    return sizes
+
+
+def scan(names=None):
+    """Partitions as BlockDevices keyed by name; only `names` if given."""
+    cmd = ["lsblk", "-J", "-b", "-o", LSBLK_COLUMNS]
+    if names is not None:
+        if not names:
+            return {}
+        cmd += [f"/dev/{name}" for name in sorted(names)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        tree = json.loads(result.stdout)['blockdevices']
+    except (ValueError, KeyError):
+        return {}
+
+    devices = {}
+    stack = list(tree)
+    while stack:
+        dev = stack.pop()
+        stack.extend(dev.get('children', []))
+        if dev.get('type') == "part":
+            devices[dev['name']] = BlockDevice(
+                dev['name'], int(dev.get('size') or 0), dev['type'],
+                dev.get('fstype'), dev.get('uuid'), dev.get('mountpoint')
+            )
+    return devices
@@ -0,0 +1,222 @@
+import subprocess, threading, shlex, uuid, time
+
+
+def command_line(cmd: str):
+    """First line of a chroot command; heredoc bodies after it may hold secrets."""
+    return cmd.split("\n", 1)[0]
+
+
+class CommandResult:
+    def __init__(self, cmd: str, returncode: int, output: str):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.output = output
+        self.start = None
+        self.duration = 0.0
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def check(self):
+        if self.returncode != 0:
+            # Only the first line: a heredoc body (like chpasswd's hashes) stays in the session
+            raise subprocess.CalledProcessError(self.returncode, command_line(self.cmd), self.output)
+        return self
+
+
+class ChrootSession:
+    """One long-lived shell inside the target root.
+
+    Commands are written to the shell's stdin and each one is followed by a
+    marker line carrying its exit status, so a single `arch-chroot` (and a
+    single round of its mount/unmount setup) serves a whole install.
+    """
+
+    # Exit status reported for batch commands skipped after an earlier failure
+    SKIPPED = -1
+
+    def __init__(self, root: str):
+        self.root = root
+        self.proc = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.proc is None:
+            self.proc = subprocess.Popen(
+                ["arch-chroot", self.root, "bash", "--noprofile", "--norc"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+                bufsize=1
+            )
+        return self
+
+    def abort(self):
+        # After a failed read the pipe may still hold the rest of a command and its
+        # marker, so the shell can't be trusted again; the next command starts a new one
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.write("exit\n")
+            self.proc.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+        self.proc.wait()
+        self.proc = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _wrap(cmd: str, marker: str, guarded: bool):
+        # Every command runs in a subshell with its own stdin, so it can neither
+        # change the session's state nor swallow the commands queued after it.
+        # It reaches the shell as one quoted word for eval: a syntax error (say an
+        # unbalanced quote) fails that command instead of leaving bash waiting
+        body = (
+            f"( eval {shlex.quote(cmd)} ) < /dev/null 2>&1; __cosmic_rc=$?\n"
+            f"printf '%s %d\\n' {marker} $__cosmic_rc\n"
+        )
+        if not guarded:
+            return body
+        return (
+            f"if [ -z \"$__cosmic_failed\" ]; then\n{body}"
+            f"[ $__cosmic_rc -ne 0 ] && __cosmic_failed=1\n"
+            f"else printf '%s skip\\n' {marker}; fi\n"
+        )
+
+    def _read_result(self, cmd: str, marker: str, on_line=None, start=None):
+        start = time.monotonic() if start is None else start
+        lines = []
+        for line in self.proc.stdout:
+            line = line.rstrip("\n")
+            pos = line.rfind(marker)
+            if pos == -1:
+                lines.append(line)
+                if on_line:
+                    on_line(line)
+                continue
+
+            # Output that did not end in a newline shares the marker's line
+            if pos > 0:
+                lines.append(line[:pos])
+                if on_line:
+                    on_line(line[:pos])
+            status = line[pos + len(marker):].strip()
+            code = self.SKIPPED if status == "skip" else int(status)
+            result = CommandResult(cmd, code, "\n".join(lines))
+            result.start, result.duration = start, time.monotonic() - start
+            return result
+
+        raise RuntimeError(f"Chroot session in {self.root} ended unexpectedly while running: {command_line(cmd)}")
+
+    def run(self, cmd: str, on_line=None):
+        with self.lock:
+            self.start()
+            marker = f"__cosmic_{uuid.uuid4().hex}__"
+            start = time.monotonic()
+            try:
+                self.proc.stdin.write(self._wrap(cmd, marker, False))
+                self.proc.stdin.flush()
+                return self._read_result(cmd, marker, on_line, start)
+            except BaseException:
+                self.abort()
+                raise
+
+    def run_batch(self, cmds: list[str], on_line=None, stop_on_error=True):
+        """Send a whole list of commands at once and collect one result each.
+
+        With `stop_on_error`, commands after the first failure are skipped and
+        reported with `SKIPPED` as their exit status.
+        """
+        with self.lock:
+            self.start()
+            markers = [f"__cosmic_{uuid.uuid4().hex}__" for _ in cmds]
+            script = "__cosmic_failed=\n" + "".join(
+                self._wrap(cmd, marker, stop_on_error) for cmd, marker in zip(cmds, markers)
+            )
+
+            # Write from a helper thread so a long batch can't deadlock against
+            # a full stdout pipe while we're still sending it
+            proc = self.proc
+
+            def write():
+                try:
+                    proc.stdin.write(script)
+                    proc.stdin.flush()
+                except (BrokenPipeError, ValueError):
+                    pass
+
+            writer = threading.Thread(target=write, daemon=True)
+            writer.start()
+            # Commands run back to back, so each one starts when the previous one ends
+            results = []
+            try:
+                for cmd, marker in zip(cmds, markers):
+                    start = results[-1].start + results[-1].duration if results else None
+                    results.append(self._read_result(cmd, marker, on_line, start))
+            except BaseException:
+                self.abort()
+                raise
+            finally:
+                writer.join()
+            return results
+
+
+class SessionPool:
+    """Chroot sessions shared by concurrently running install steps.
+
+    A session is handed to one caller at a time; new ones are only started
+    when every existing session is busy.
+    """
+
+    def __init__(self, root: str, factory=ChrootSession):
+        self.root = root
+        self.factory = factory
+        self.idle = []
+        self.all = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            session = self.factory(self.root)
+            self.all.append(session)
+            return session
+
+    def release(self, session: ChrootSession):
+        with self.lock:
+            self.idle.append(session)
+
+    def run(self, cmd: str, on_line=None):
+        session = self.acquire()
+        try:
+            return session.run(cmd, on_line)
+        finally:
+            self.release(session)
+
+    def run_batch(self, cmds: list[str], on_line=None, stop_on_error=True):
+        session = self.acquire()
+        try:
+            return session.run_batch(cmds, on_line, stop_on_error)
+        finally:
+            self.release(session)
+
+    def close(self):
+        with self.lock:
+            for session in self.all:
+                session.close()
+            self.idle = list(self.all)
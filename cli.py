@@ -0,0 +1,150 @@
+import argparse, threading, tempfile, json, time, sys, os
+
+from install_system import Installer, BASE_PACKAGES, package_lists
+from settings import load_settings, validate_settings
+from executor import RealExecutor, DryRunExecutor, RecordingExecutor, ReplayExecutor
+from profiles import DEFAULT_PROFILE
+from pkgcache import PackageCache
+from blockdev import human_size
+import syncdb
+
+
+class ConsoleLogger:
+    def __init__(self, verbose=True):
+        self.logger = self
+        self.verbose = verbose
+        self.lock = threading.Lock()
+
+    def log(self, msg):
+        with self.lock:
+            print(msg, flush=True)
+
+    def output(self, step, line):
+        if self.verbose:
+            with self.lock:
+                print(f"    [{step}] {line}", flush=True)
+
+    def phase(self, step, state):
+        pass
+
+
+class JsonLinesLogger:
+    """One JSON object per line on stdout, for scripts driving many installs."""
+
+    def __init__(self, stream=sys.stdout):
+        self.logger = self
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def emit(self, **event):
+        event['time'] = round(time.time(), 3)
+        with self.lock:
+            self.stream.write(json.dumps(event) + "\n")
+            self.stream.flush()
+
+    def log(self, msg):
+        self.emit(type="log", msg=msg)
+
+    def output(self, step, line):
+        self.emit(type="output", step=step, line=line)
+
+    def phase(self, step, state):
+        self.emit(type="phase", step=step, state=state)
+
+
+def preflight(sett: dict):
+    """Check every repo package against the host's sync databases and print the sizes."""
+    try:
+        index = syncdb.load_index()
+    except Exception as e:
+        print(f"Couldn't read the pacman sync databases ({e}), not checking the packages.", file=sys.stderr)
+        return True
+    if index is None:
+        print("No pacman sync databases on this system, not checking the packages.")
+        return True
+
+    pkgs, aur = package_lists(sett['de'], sett.get('profile', DEFAULT_PROFILE))
+    cached = PackageCache(sett['cache']).packages() if sett.get('cache') else []
+    check = syncdb.Preflight(index, BASE_PACKAGES + pkgs, cached)
+    print(
+        f"{len(check.packages)} packages (+{len(aur)} from the AUR): "
+        f"{human_size(check.download)} to download, {human_size(check.installed)} installed"
+    )
+    if check.unverified:
+        print(f"Warning: {check.warning()}", file=sys.stderr)
+    if check.missing:
+        print(f"Invalid settings: {check.problem()}", file=sys.stderr)
+        return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Unattended CosmicOS installation (no GUI).")
+    parser.add_argument("settings", help="JSON settings file")
+    parser.add_argument("--root", help="where to mount the new system (default: /mnt/install; not with --dry-run/--replay)")
+    parser.add_argument("--log", choices=["console", "jsonl"], default="console")
+    parser.add_argument("--quiet", action="store_true", help="console log: only show milestones")
+    parser.add_argument("--check", action="store_true", help="only validate the settings file (and check the packages)")
+    parser.add_argument("--no-preflight", action="store_true", help="don't check the packages against the sync databases")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--dry-run", action="store_true", help="log the commands instead of running them")
+    mode.add_argument("--replay", metavar="TRACE", help="play back a recorded command trace")
+    parser.add_argument("--record", metavar="TRACE", help="record every command, its output and duration")
+    parser.add_argument("--speed", type=float, default=1.0, help="time scale for --dry-run and --replay (0 = instant)")
+    args = parser.parse_args(argv)
+
+    try:
+        sett = load_settings(args.settings)
+    except (OSError, ValueError) as e:
+        print(f"Can't read settings: {e}", file=sys.stderr)
+        return 2
+
+    errors = validate_settings(sett)
+    if errors:
+        for error in errors:
+            print(f"Invalid settings: {error}", file=sys.stderr)
+        return 2
+    # Image installs don't install any packages
+    if not args.no_preflight and not sett.get('image') and not preflight(sett):
+        return 2
+    if args.check:
+        print("Settings OK.")
+        return 0
+
+    if args.dry_run or args.replay:
+        # Only commands are simulated; the installer's own file work (fstab, AUR
+        # staging, cleanups) is real, so it must never land in a real target
+        if args.root:
+            print("--root can't be used with --dry-run or --replay, they always use a scratch root.", file=sys.stderr)
+            return 2
+        scratch = tempfile.mkdtemp(prefix="cosmic-dry-")
+        args.root = os.path.join(scratch, "root")
+        sett.setdefault('journal', os.path.join(scratch, "journal.json"))
+        sett.setdefault('trace', os.path.join(scratch, "trace.json"))
+    root = args.root or "/mnt/install"
+
+    if args.dry_run:
+        executor = DryRunExecutor(scale=args.speed)
+    elif args.replay:
+        executor = ReplayExecutor(args.replay, root, args.speed)
+    else:
+        executor = RealExecutor()
+    if args.record:
+        executor = RecordingExecutor(executor, root)
+
+    app = JsonLinesLogger() if args.log == "jsonl" else ConsoleLogger(not args.quiet)
+    inst = Installer(app, root, sett, executor)
+    try:
+        inst.install()
+    except Exception as e:
+        app.log(f"Installation failed: {e}")
+        inst.unmount_all()
+        return 1
+    finally:
+        if args.record:
+            executor.save(args.record)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
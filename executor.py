@@ -0,0 +1,221 @@
+import threading, json, time
+from abc import ABC, abstractmethod
+
+from chroot import ChrootSession, CommandResult, command_line
+from stream import run_streamed
+
+
+class Executor(ABC):
+    """Runs the installer's external commands.
+
+    `run` executes a host command and returns its exit status, passing every
+    output line to `on_line`; `session` opens a shell inside the target root
+    (see chroot.ChrootSession for the interface).
+    """
+
+    @abstractmethod
+    def run(self, cmd: list[str], on_line, **kwargs):
+        ...
+
+    @abstractmethod
+    def session(self, root: str):
+        ...
+
+
+class RealExecutor(Executor):
+    def run(self, cmd: list[str], on_line, **kwargs):
+        return run_streamed(cmd, on_line, check=False, **kwargs)
+
+    def session(self, root: str):
+        return ChrootSession(root)
+
+
+class SimulatedSession:
+    """Stands in for a ChrootSession; every command is answered by `answer(cmd, on_line)`."""
+
+    def __init__(self, answer):
+        self.answer = answer
+
+    def start(self):
+        return self
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def run(self, cmd: str, on_line=None):
+        start = time.monotonic()
+        code, output = self.answer(cmd, on_line)
+        result = CommandResult(cmd, code, output)
+        result.start, result.duration = start, time.monotonic() - start
+        return result
+
+    def run_batch(self, cmds: list[str], on_line=None, stop_on_error=True):
+        results = []
+        for cmd in cmds:
+            if stop_on_error and results and not results[-1].ok:
+                results.append(CommandResult(cmd, ChrootSession.SKIPPED, ""))
+            else:
+                results.append(self.run(cmd, on_line))
+        return results
+
+
+# Rough durations (seconds) of the slow tools, used by dry runs
+DEFAULT_TIMINGS = {
+    "pacstrap": 120.0, "pacman": 300.0, "runuser": 240.0, "git": 5.0,
+    "grub-install": 3.0, "grub-mkconfig": 3.0, "locale-gen": 4.0, "tar": 40.0, "unsquashfs": 30.0,
+    "mkfs.ext4": 2.0, "mkfs.btrfs": 1.0, "mkfs.xfs": 1.0, "mkfs.fat": 0.5
+}
+
+
+class DryRunExecutor(Executor):
+    """Logs every command instead of running it and sleeps for its simulated duration.
+
+    `scale` shrinks the simulated timings (0 makes a dry run instant).
+    """
+
+    def __init__(self, timings: dict = None, default: float = 0.05, scale: float = 1.0):
+        self.timings = DEFAULT_TIMINGS if timings is None else timings
+        self.default = default
+        self.scale = scale
+
+    def simulate(self, program: str):
+        time.sleep(self.timings.get(program, self.default) * self.scale)
+
+    def run(self, cmd: list[str], on_line, **kwargs):
+        on_line(f"$ {' '.join(cmd)}")
+        self.simulate(cmd[0])
+        return 0
+
+    def session(self, root: str):
+        def answer(cmd, on_line):
+            if on_line:
+                on_line(f"# {command_line(cmd)}")
+            self.simulate(cmd.split()[0] if cmd.split() else "")
+            return 0, ""
+        return SimulatedSession(answer)
+
+
+class RecordingExecutor(Executor):
+    """Wraps another executor and records every command, its output and duration.
+
+    The target root in command lines is stored as `{root}`, so a trace can be
+    replayed against a different root.
+    """
+
+    def __init__(self, inner: Executor, root: str):
+        self.inner = inner
+        self.root = root
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def add(self, kind: str, cmd, returncode: int, output: list[str], duration: float):
+        cmd = " ".join(cmd) if isinstance(cmd, list) else cmd
+        with self.lock:
+            self.entries.append({
+                'kind': kind, 'cmd': cmd.replace(self.root, "{root}"), 'returncode': returncode,
+                'output': output, 'duration': duration
+            })
+
+    def run(self, cmd: list[str], on_line, **kwargs):
+        output = []
+
+        def record(line):
+            output.append(line)
+            on_line(line)
+
+        start = time.monotonic()
+        code = self.inner.run(cmd, record, **kwargs)
+        self.add("run", cmd, code, output, time.monotonic() - start)
+        return code
+
+    def session(self, root: str):
+        inner = self.inner.session(root)
+        recorder = self
+
+        class RecordingSession:
+            def start(self):
+                inner.start()
+                return self
+
+            def close(self):
+                inner.close()
+
+            def __enter__(self):
+                return self.start()
+
+            def __exit__(self, *exc):
+                self.close()
+
+            def keep(self, result):
+                if result.returncode != ChrootSession.SKIPPED:
+                    recorder.add("chroot", command_line(result.cmd), result.returncode, result.output.split("\n") if result.output else [], result.duration)
+                return result
+
+            def run(self, cmd, on_line=None):
+                return self.keep(inner.run(cmd, on_line))
+
+            def run_batch(self, cmds, on_line=None, stop_on_error=True):
+                return [self.keep(res) for res in inner.run_batch(cmds, on_line, stop_on_error)]
+
+        return RecordingSession()
+
+    def save(self, path: str):
+        with self.lock:
+            with open(path, "w") as f:
+                json.dump({'commands': self.entries}, f, indent=1)
+
+
+class ReplayExecutor(Executor):
+    """Plays back a recorded trace: same output, exit codes and (scaled) durations.
+
+    Commands are matched by their text, in the order they were recorded, so
+    steps that ran concurrently may come back in a different order. Commands
+    whose text differs between runs (random salts, for one) fall back to the
+    next recorded command of the same program.
+    """
+
+    def __init__(self, path: str, root: str, scale: float = 1.0):
+        with open(path, "r") as f:
+            self.entries = json.load(f)['commands']
+        self.root = root
+        self.scale = scale
+        self.lock = threading.Lock()
+
+    def next(self, kind: str, cmd):
+        cmd = " ".join(cmd) if isinstance(cmd, list) else command_line(cmd)
+        cmd = cmd.replace(self.root, "{root}")
+        program = cmd.split(" ", 1)[0]
+        with self.lock:
+            candidates = [e for e in self.entries if e['kind'] == kind]
+            entry = next((e for e in candidates if e['cmd'] == cmd), None) or \
+                next((e for e in candidates if e['cmd'].split(" ", 1)[0] == program), None)
+            if entry is None:
+                raise RuntimeError(f"Command not in the recorded trace: {cmd}")
+            self.entries.remove(entry)
+            return entry
+
+    def play(self, entry: dict, on_line):
+        # Spread the output over the recorded duration, like the real command
+        lines = entry['output']
+        delay = entry['duration'] * self.scale / (len(lines) + 1)
+        for line in lines:
+            time.sleep(delay)
+            if on_line:
+                on_line(line)
+        time.sleep(delay)
+        return entry['returncode']
+
+    def run(self, cmd: list[str], on_line, **kwargs):
+        return self.play(self.next("run", cmd), on_line)
+
+    def session(self, root: str):
+        def answer(cmd, on_line):
+            entry = self.next("chroot", cmd)
+            return self.play(entry, on_line), "\n".join(entry['output'])
+        return SimulatedSession(answer)
@@ -0,0 +1,153 @@
+import subprocess, os, re
+
+
+# fstab of the target, built from what is actually mounted under its root
+# (/proc/self/mountinfo) and the partitions' UUIDs, instead of genfstab.
+
+MOUNTINFO = "/proc/self/mountinfo"
+BY_UUID = "/dev/disk/by-uuid"
+
+# Mount options per filesystem; 'mount_options' in the settings overrides them
+MOUNT_OPTIONS = {
+    "ext4": "rw,noatime",
+    "btrfs": "rw,noatime,compress=zstd:1,space_cache=v2",
+    "xfs": "rw,noatime,inode64",
+    "vfat": "rw,noatime,fmask=0077,dmask=0077,codepage=437,iocharset=ascii,shortname=mixed,utf8,errors=remount-ro"
+}
+
+# 'periodic' trims once a week with fstrim.timer, 'continuous' on every delete
+DISCARD_POLICIES = ("periodic", "continuous", "none")
+CONTINUOUS_DISCARD = {"btrfs": "discard=async"}
+
+# fsck order: the root first, then everything else; btrfs and xfs don't use fsck at boot
+NO_FSCK = ("btrfs", "xfs")
+
+
+class Mount:
+    def __init__(self, source: str, path: str, fstype: str, root: str, options: str):
+        self.source = source
+        self.path = path
+        self.fstype = fstype
+        self.root = root
+        self.options = options
+
+
+def unescape(field: str):
+    # mountinfo writes spaces, tabs and newlines in paths as octal escapes
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+
+def escape(field: str):
+    return field.replace("\\", "\\134").replace(" ", "\\040").replace("\t", "\\011").replace("\n", "\\012")
+
+
+def read_mountinfo(path: str = MOUNTINFO):
+    mounts = []
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.split()
+            # Optional fields end at '-': then fstype, source, super options
+            sep = fields.index("-")
+            root, point = unescape(fields[3]), unescape(fields[4])
+            fstype, source, options = fields[sep + 1], unescape(fields[sep + 2]), fields[sep + 3]
+            mounts.append(Mount(source, point, fstype, root, options))
+    return mounts
+
+
+def target_mounts(target: str, mounts: list[Mount]):
+    """The block device mounts under `target`, as paths inside it, parents first.
+
+    Bind mounts (like a host package cache) are left out; a btrfs subvolume
+    shows up like one, so those are recognised by their subvol= option.
+    """
+    target = target.rstrip("/")
+    found = {}
+    for mount in mounts:
+        if mount.path != target and not mount.path.startswith(f"{target}/"):
+            continue
+        if not mount.source.startswith("/dev/"):
+            continue
+        subvol = re.search(r"(?:^|,)subvol=([^,]*)", mount.options) if mount.fstype == "btrfs" else None
+        if mount.root != "/" and not (subvol and subvol.group(1) == mount.root):
+            continue
+        # Mounted over an earlier mount: the last one is what's visible
+        found[mount.path[len(target):] or "/"] = mount
+    return sorted(found.items(), key=lambda item: (len([c for c in item[0].split("/") if c]), item[0]))
+
+
+def device_uuids(by_uuid: str = BY_UUID):
+    uuids = {}
+    if os.path.isdir(by_uuid):
+        for uuid in os.listdir(by_uuid):
+            uuids.setdefault(os.path.realpath(os.path.join(by_uuid, uuid)), uuid)
+    return uuids
+
+
+def probe_uuid(dev: str):
+    # udev may not have made the by-uuid link for a freshly formatted partition yet
+    try:
+        res = subprocess.run(["blkid", "-s", "UUID", "-o", "value", dev], stdout=subprocess.PIPE, text=True)
+    except OSError:
+        return None
+    return res.stdout.strip() or None
+
+
+def mount_options(mount: Mount, overrides: dict = None, part: dict = None, discard: str = "periodic"):
+    options = (part or {}).get('mount_options') or (overrides or {}).get(mount.fstype) or MOUNT_OPTIONS.get(mount.fstype, "rw,noatime")
+    options = options.split(",")
+    if mount.fstype == "btrfs" and mount.root != "/":
+        options.append(f"subvol={mount.root}")
+    if discard == "continuous":
+        options.append(CONTINUOUS_DISCARD.get(mount.fstype, "discard"))
+    return ",".join(dict.fromkeys(options))
+
+
+def fstab_entries(target: str, parts: list[dict] = (), overrides: dict = None, discard: str = "periodic", mountinfo: str = MOUNTINFO):
+    """fstab lines (a '# device' comment and the entry) for everything mounted under `target`."""
+    uuids = device_uuids()
+    by_dev = {}
+    for part in parts:
+        by_dev.setdefault(os.path.realpath(part['part']), part)
+
+    lines = []
+    for path, mount in target_mounts(target, read_mountinfo(mountinfo)):
+        dev = os.path.realpath(mount.source)
+        uuid = uuids.get(dev) or probe_uuid(dev)
+        spec = f"UUID={uuid}" if uuid else mount.source
+        options = mount_options(mount, overrides, by_dev.get(dev), discard)
+        passno = 0 if mount.fstype in NO_FSCK else 1 if path == "/" else 2
+        lines.append(f"# {mount.source}")
+        lines.append(f"{spec}\t{escape(path)}\t{mount.fstype}\t{options}\t0 {passno}")
+    return lines
+
+
+def write_fstab(path: str, entries: list[str]):
+    """Replace the entries for the generated mount points and keep everything else.
+
+    Written to a temporary file and renamed over the old one, so running it
+    again gives the same file and a crash never leaves half an fstab.
+    """
+    points = {line.split("\t")[1] for line in entries if not line.startswith("#")}
+    kept = []
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                fields = line.split()
+                # Our own '# /dev/...' comments come back with the entries
+                if line.startswith("# /dev/") or (fields and not line.startswith("#") and len(fields) > 1 and fields[1] in points):
+                    continue
+                kept.append(line)
+    except FileNotFoundError:
+        pass
+    while kept and not kept[-1]:
+        kept.pop()
+
+    text = "\n".join(kept + [""] + entries if kept else entries) + "\n"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,34 @@
+import os
+
+
+# Prebuilt root images, for imaging many machines with the same system:
+# a tar.zst archive or a squashfs of an installed root.
+
+IMAGE_SUFFIXES = (".tar.zst", ".sqfs", ".squashfs")
+
+
+def find_image(location: str, de: str, profile: str):
+    """`location` itself, or '<de>-<profile>.<suffix>' when it's a directory of images."""
+    if os.path.isdir(location):
+        for suffix in IMAGE_SUFFIXES:
+            path = os.path.join(location, f"{de}-{profile}{suffix}")
+            if os.path.isfile(path):
+                return path
+        raise ValueError(f"No image for {de}-{profile} in {location}")
+    if not location.endswith(IMAGE_SUFFIXES):
+        raise ValueError(f"Unknown image format: {location} (use {', '.join(IMAGE_SUFFIXES)})")
+    if not os.path.isfile(location):
+        raise ValueError(f"Image not found: {location}")
+    return location
+
+
+def unpack_command(image: str, root: str, threads: int = None):
+    threads = threads or os.cpu_count() or 1
+    if image.endswith(".tar.zst"):
+        # zstd decompresses on one core; tar writing its output to disk runs next to it
+        return [
+            "tar", "--use-compress-program", "zstd -d --long=31", "-xpf", image, "-C", root,
+            "--numeric-owner", "--xattrs", "--xattrs-include=*", "--acls"
+        ]
+    # unsquashfs decompresses blocks on every core
+    return ["unsquashfs", "-f", "-no-progress", "-processors", str(threads), "-d", root, image]
@@ -1,43 +1,198 @@
-import subprocess, hashlib, base64, os
+import subprocess, threading, tempfile, hashlib, shutil, shlex, glob, os
+from concurrent.futures import ThreadPoolExecutor
+
+from chroot import ChrootSession, SessionPool, command_line
+from scheduler import Scheduler
+from journal import Journal, JOURNAL_DIR
+from executor import RealExecutor
+from pkgcache import PackageCache
+from timing import Tracer, short_name
+from pwhash import Hasher, HASH_TIME
+from profiles import load_profiles, resolve, DEFAULT_PROFILE
+from image import find_image, unpack_command
+from storage import mkfs_command, mount_plan
+from fstab import fstab_entries, write_fstab
+from aur import (
+    AurCache, AUR_URL, read_srcinfo, git_head, build_key, repo_depends, provided_names, build_graph, build_order, chain_keys,
+    build_jobs, makeflags, installable
+)
+from syncdb import load_index
+
+
+BASE_PACKAGES = ["base", "linux", "linux-firmware", "bash", "nano", "networkmanager", "grub", "efibootmgr", "sudo"]
+
+TRACE_FILE = "/var/log/cosmicos-install-trace.json"
+
+# Install steps allowed to run at the same time
+DEFAULT_JOBS = min(4, os.cpu_count() or 1)
+
+# Passwords hashed at the same time (yescrypt needs a lot of memory per hash)
+HASH_JOBS = min(4, os.cpu_count() or 1)
+
+# AUR clones fetched at the same time
+AUR_FETCH_JOBS = 8
+
+# Where AUR packages are built inside the target. Not /tmp: every arch-chroot
+# session mounts its own tmpfs there, which would hide the sources from the
+# others (and keep big builds in RAM)
+AUR_STAGE = "/var/tmp/cosmic-aur"
+
+# Parallel downloads configured in the target's pacman.conf
+PARALLEL_DOWNLOADS = 8
+
+DESKTOPS = {
+    'gnome': [
+        "gnome-app-list", "gnome-backgrounds", "gnome-calculator", "gnome-characters", "gnome-connections", "gnome-control-center",
+        "gnome-desktop",  "gnome-desktop-4", "gnome-desktop-common", "gnome-disk-utility", "gdm", "gnome-font-viewer", "gnome-keybindings",
+        "gnome-keyring", "gnome-logs", "gnome-session", "gnome-settings-daemon", "gnome-shell", "gnome-shell-extensions",
+        "gnome-shell-extension-pop-shell", "gnome-software", "gnome-system-monitor", "gnome-terminal", "gnome-themes-extra", "gnome-tweaks",
+        "xdg-desktop-portal-gnome", "nautilus"
+    ],
+    'plasma': [
+        "aurorae", "bluedevil", "breeze", "breeze-gtk", "breeze-plymouth", "discover", "drkonqi", "flatpak-kcm", "kactivitymanagerd",
+        "kde-cli-tools", "kde-gtk-config", "kdecoration", "kdeplasma-addons", "kgamma", "kglobalacceld", "kinfocenter", "kmenuedit",
+        "kpipewire", "krdp", "kscreen", "kscreenlocker", "ksshaskpass", "ksystemstats", "kwayland", "kwin", "kwin-x11", "kwrited",
+        "layer-shell-qt", "libkscreen", "libksysguard", "libplasma", "milou", "ocean-sound-theme", "oxygen", "oxygen-sounds",
+        "plasma-activities", "plasma-activities-stats", "plasma-browser-integration", "plasma-desktop", "plasma-disks", "plasma-firewall",
+        "plasma-integration", "plasma-nm", "plasma-pa", "plasma-sdk", "plasma-systemmonitor", "plasma-thunderbolt", "plasma-vault",
+        "plasma-workspace", "plasma-workspace-wallpapers", "plasma5support", "plymouth-kcm", "polkit-kde-agent", "powerdevil",
+        "print-manager", "qqc2-breeze-style", "sddm", "sddm-kcm", "spectacle", "systemsettings", "xdg-desktop-portal-kde"
+    ],
+    'mate': [
+        "caja", "marco", "mate-backgrounds", "mate-control-center", "mate-desktop", "mate-icon-theme", "mate-menus", "mate-panel",
+        "mate-notification-daemon", "mate-polkit", "mate-session-manager", "mate-settings-daemon", "mate-themes", "mate-user-guide"
+    ],
+    'hypr': [
+        "hyprland", "waybar", "rofi", "hyprpaper", "sddm", "hyprcursor", "hyprgraphics", "hypridle", "hyprland-qt-support", "hyprland-qtutils",
+        "hyprlang", "hyprlock", "hyprshot", "hyprutils"
+    ]
+}
+
+
+def package_lists(de: str, profile: str = DEFAULT_PROFILE):
+    """(repo packages, AUR packages) installed after pacstrap for a desktop and package profile."""
+    if de not in DESKTOPS.keys():
+        raise ValueError("Wrong desktop environment. Choose from 'gnome', 'plasma', 'mate' and 'hypr'.")
+    packages, aur = resolve(load_profiles(), profile)
+    # One ordered, deduplicated set for a single pacman transaction
+    return list(dict.fromkeys(DESKTOPS[de] + packages)), aur
 
 
 class Installer:
-    def __init__(self, app, root: str, settings: dict):
+    def __init__(self, app, root: str, settings: dict, executor=None):
         self.app = app
         self.root = root
         self.sett = settings
+        # Every external command goes through this (real, dry-run, record or replay)
+        self.executor = executor or RealExecutor()
+        self.local = threading.local()
+        self.tracer = Tracer()
+        self.session = SessionPool(root, self.executor.session)
+
+        # Finished steps survive a failed run, so the same settings can resume
+        target = hashlib.sha256(f"{root}:{[p.get('part') for p in settings.get('parts', [])]}".encode()).hexdigest()[:16]
+        self.journal = Journal(settings.get('journal', f"{JOURNAL_DIR}/journal-{target}.json"))
+        self.digests = {}
+        self.prefetch = None
+        self.prefetch_error = None
+        self.hashing = None
+        self.hashes = {}
+        self.hash_error = None
+
+        # Desktop, package profile and AUR apps
+        self.pkgs, self.aur = package_lists(settings['de'], settings.get('profile', DEFAULT_PROFILE))
+
+        # Image installs unpack a prebuilt root instead of installing packages
+        self.image = find_image(settings['image'], settings['de'], settings.get('profile', DEFAULT_PROFILE)) if settings.get('image') else None
+
+        # Optional shared package cache on the host (directory or file:// repo)
+        self.cache = PackageCache(settings['cache']) if settings.get('cache') else None
+
+        # AUR builds are kept on the host when 'aur_cache' is set, otherwise just for this install
+        self.aur_cache = AurCache(settings.get('aur_cache') or f"{root}/var/cache/cosmicos-aur")
+
+    @property
+    def step(self):
+        return getattr(self.local, 'step', "setup")
+
+    @step.setter
+    def step(self, value: str):
+        self.local.step = value
+
+    def format_parts(self):
+        parts = [part for part in self.sett['parts'] if part.get('fs')]
+        if not parts:
+            self.app.logger.log(f"  Nothing to format.")
+            return
+        step = self.step
+
+        def format_part(part):
+            self.step = step
+            self.app.logger.log(f"  Formatting {part['part']} as {part['fs']}...")
+            self.run(mkfs_command(part['fs'], part['part'], part.get('options', [])))
+            if part.get('subvolumes'):
+                self.create_subvolumes(part)
+
+        # All partitions at once; a big /home shouldn't hold up the others
+        with ThreadPoolExecutor(max_workers=len(parts)) as pool:
+            for future in [pool.submit(format_part, part) for part in parts]:
+                future.result()
+
+    def create_subvolumes(self, part: dict):
+        top = tempfile.mkdtemp(prefix="cosmic-btrfs-")
+        self.run(["mount", part['part'], top])
+        try:
+            for subvol in part['subvolumes']:
+                self.run(["btrfs", "subvolume", "create", f"{top}/{subvol}"])
+        finally:
+            self.run(["umount", top], check=False)
+            os.rmdir(top)
 
-    def mount_part(self, dev: str, path: str):
+    def mount_part(self, dev: str, path: str, options: str = None):
         self.app.logger.log(f"  Mounting {dev} at {path}.")
-        subprocess.run(["mkdir", "-p", path])
-        subprocess.run(["mount", dev, path])
+        os.makedirs(path, exist_ok=True)
+        self.run(["mount"] + (["-o", options] if options else []) + [dev, path])
 
     def install_base(self):
-        subprocess.run(
-            ["pacstrap", self.root, "base", "linux", "linux-firmware", "bash", "nano", "networkmanager", "grub", "efibootmgr", "sudo"],
-            check=True,
-            env=os.environ.copy()
-        )
+        self.run(["pacstrap", self.root] + BASE_PACKAGES, env=os.environ.copy())
+
+    def deploy_image(self):
+        self.app.logger.log(f"  Unpacking {os.path.basename(self.image)}...")
+        self.run(unpack_command(self.image, self.root))
+
+        # Per-machine files that came with the image: fstab is generated next,
+        # and an empty machine-id makes systemd create a new one on first boot
+        if os.path.exists(f"{self.root}/etc/fstab"):
+            os.remove(f"{self.root}/etc/fstab")
+        if os.path.exists(f"{self.root}/etc/machine-id"):
+            open(f"{self.root}/etc/machine-id", "w").close()
 
     def gen_fstab(self):
-        with open(f"{self.root}/etc/fstab", "a") as f:
-            subprocess.run(["genfstab", "-U", self.root], stdout=f)
+        discard = self.sett.get('discard', "periodic")
+        entries = fstab_entries(self.root, self.sett['parts'], self.sett.get('mount_options'), discard)
+        self.app.logger.log(f"  Writing {len(entries) // 2} mount(s) to /etc/fstab...")
+        write_fstab(f"{self.root}/etc/fstab", entries)
+        if discard == "periodic":
+            self.crexe("systemctl enable fstrim.timer")
 
     def sys_config(self):
-        self.app.logger.log(f"  Setting timezone...")
-        self.crexe(f"ln -sf /usr/share/zoneinfo/{self.sett['location']['timezone']} /etc/localtime")
-        self.app.logger.log(f"  Setting language...")
-        self.crexe(f"echo \"LANG={self.sett['location']['language']}\" > /etc/locale.conf")
-        self.crexe(f"sed -i 's/^#\\({self.sett['location']['language']} UTF-8\\)/\\1/' /etc/locale.gen")
-        self.app.logger.log(f"  Setting hostname...")
-        self.crexe(f"echo \"{self.sett['hostname']}\" > /etc/hostname")
-        self.app.logger.log(f"  Enabling multilib...")
-        self.crexe("sed -i '/\\[multilib\\]/,/Include/s/^#//' /etc/pacman.conf")
+        self.app.logger.log(f"  Setting timezone, language and hostname...")
+        self.app.logger.log(f"  Enabling multilib and parallel downloads...")
+        # Settings are quoted, nothing in them reaches the shell as syntax
+        timezone, language = self.sett['location']['timezone'], self.sett['location']['language']
+        uncomment = "s/^#\\(" + language.replace(".", "\\.").replace("/", "\\/") + " UTF-8\\)/\\1/"
+        self.crexe_batch([
+            f"ln -sf {shlex.quote('/usr/share/zoneinfo/' + timezone)} /etc/localtime",
+            f"echo {shlex.quote('LANG=' + language)} > /etc/locale.conf",
+            f"sed -i {shlex.quote(uncomment)} /etc/locale.gen",
+            f"echo {shlex.quote(self.sett['hostname'])} > /etc/hostname",
+            "sed -i '/\\[multilib\\]/,/Include/s/^#//' /etc/pacman.conf",
+            f"sed -i 's/^#\\?ParallelDownloads.*/ParallelDownloads = {PARALLEL_DOWNLOADS}/' /etc/pacman.conf"
+        ])
 
         self.app.logger.log(f"  Regenerating language config...")
-        self.crexe("locale-gen")
         self.app.logger.log(f"  Synchronizing hardware clock...")
-        self.crexe("hwclock --systohc")
+        self.crexe_batch(["locale-gen", "hwclock --systohc"])
 
     def bootloader(self):
         self.app.logger.log(f"  Installing grub...")
@@ -49,175 +204,456 @@ class Installer:
         self.crexe("grub-mkconfig -o /boot/grub/grub.cfg")
 
     def enable_stuff(self):
-        self.app.logger.log(f"  Enabling Network Manager...")
-        self.crexe("systemctl enable NetworkManager")
-        self.app.logger.log(f"  Enabling SSH")
-        self.crexe("systemctl enable sshd")
+        self.app.logger.log(f"  Enabling Network Manager and SSH...")
+        self.crexe_batch(["systemctl enable NetworkManager", "systemctl enable sshd"])
+
+    def accounts(self):
+        # 'users' is either one account (what the GUI builds) or a list of them under 'accounts'
+        users = self.sett['users']
+        if 'accounts' in users:
+            return users['accounts']
+        return [{'name': users['name'], 'pass': users['pass'], 'sudo': users.get('sudo', False), 'groups': users.get('groups', [])}]
+
+    def hash_passwords(self):
+        # Calibrating and hashing takes a while, so it runs next to pacstrap
+        if self.hashing is not None:
+            return
+        passwords = [("root", self.sett['users']['root_pass'])] + [(acc['name'], acc['pass']) for acc in self.accounts()]
+        hasher = Hasher(self.sett.get('password_hash', "yescrypt"), self.sett.get('hash_time', HASH_TIME))
+
+        def work():
+            try:
+                with self.tracer.span("hash"):
+                    cost = hasher.calibrate()
+                    self.app.logger.log(f"  Hashing {len(passwords)} passwords with {hasher.scheme} (cost {cost})...")
+                    # libcrypt releases the GIL, so these really run side by side
+                    with ThreadPoolExecutor(max_workers=HASH_JOBS) as pool:
+                        hashes = pool.map(hasher.hash, [password for _, password in passwords])
+                        self.hashes = dict(zip([name for name, _ in passwords], hashes))
+            except Exception as e:
+                self.hash_error = e
+
+        self.hashing = threading.Thread(target=work, daemon=True)
+        self.hashing.start()
+
+    def wait_hashes(self):
+        self.hash_passwords()
+        self.app.logger.log(f"  Waiting for password hashes...")
+        self.hashing.join()
+        if self.hash_error is not None:
+            raise self.hash_error
+
+    def chpasswd(self):
+        # All passwords (root included) in one chpasswd, through the session's stdin and never argv
+        entries = "\n".join(f"{name}:{hashed}" for name, hashed in self.hashes.items())
+        return f"chpasswd -e <<'EOF'\n{entries}\nEOF"
 
     def add_users(self):
-        # Hash password
-        self.app.logger.log(f"  Hashing password...")
-        salt = base64.b64encode(os.urandom(6)).decode('utf-8')
-        hashed_pw = f"$6${salt}${hashlib.sha512((self.sett['users']['pass'] + salt).encode()).hexdigest()}"
-        
-        # Add user
-        self.app.logger.log(f"  Creating user...")
-        self.crexe(f"useradd -m -p {hashed_pw} -s /bin/bash {self.sett['users']['name']}")
-
-        # Enable wheel group
-        self.app.logger.log(f"  Enabling wheel group...")
-        self.crexe("sed -i 's/^# %wheel ALL=(ALL) ALL/%wheel ALL=(ALL) ALL/' /etc/sudoers")
-        
-        # If user is sudo, add him to the wheel group
-        if self.sett['users']['sudo']:
-            self.app.logger.log(f"    Adding user to wheel...")
-            self.crexe(f"usermod -aG wheel {self.sett['users']['name']}")
-
-        # Set root password
-        self.app.logger.log(f"  Setting root password...")
-        try:
-            proc = subprocess.Popen(
-                ["arch-chroot", self.root, "bash", "-c", "passwd root"],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            proc.communicate(f"{self.sett['users']['root_pass']}\n{self.sett['users']['root_pass']}\n")
-        except Exception as e:
-            print(f"Error: {e}")
+        self.wait_hashes()
+
+        # Everything goes through one batch: enable the wheel group, create the
+        # extra groups and every account, then set all passwords
+        accounts = self.accounts()
+        self.app.logger.log(f"  Creating {len(accounts)} user(s)...")
+        groups = list(dict.fromkeys(group for acc in accounts for group in acc.get('groups', [])))
+        cmds = ["sed -i 's/^# %wheel ALL=(ALL) ALL/%wheel ALL=(ALL) ALL/' /etc/sudoers"]
+        cmds += [f"groupadd -f {group}" for group in groups]
+
+        for acc in accounts:
+            name = acc['name']
+            extra = ",".join(dict.fromkeys(acc.get('groups', []) + (["wheel"] if acc.get('sudo') else [])))
+            # Accounts may already exist when a half-finished step is resumed
+            if extra:
+                cmds.append(f"id -u {name} >/dev/null 2>&1 && usermod -aG {extra} {name} || useradd -m -G {extra} -s /bin/bash {name}")
+            else:
+                cmds.append(f"id -u {name} >/dev/null 2>&1 || useradd -m -s /bin/bash {name}")
+
+        cmds.append(self.chpasswd())
+        self.app.logger.log(f"  Setting passwords...")
+        self.crexe_batch(cmds)
+
+    def set_passwords(self):
+        # The journal doesn't know the passwords, so a skipped users step sets them again
+        self.wait_hashes()
+        self.app.logger.log(f"  Setting passwords...")
+        self.crexe_batch([self.chpasswd()])
+
+    def packages(self):
+        return self.pkgs
+
+    def prefetch_packages(self):
+        # Download everything in the background while the other phases run;
+        # this uses its own chroot so it doesn't hold up the main session
+        if self.prefetch is not None:
+            return
+        pkgs = self.packages()
+        self.app.logger.log(f"  Downloading {len(pkgs)} packages in the background...")
+
+        def fetch():
+            self.app.logger.phase("download", "start")
+            try:
+                with self.tracer.span("download"), self.executor.session(self.root) as session:
+                    cmd = f"pacman -Syuw --noconfirm {' '.join(pkgs)}"
+                    self.traced(session.run(cmd, on_line=lambda line: self.output(line, "download"))).check()
+            except Exception as e:
+                self.prefetch_error = e
+            else:
+                self.app.logger.phase("download", "done")
+
+        self.prefetch = threading.Thread(target=fetch, daemon=True)
+        self.prefetch.start()
 
     def install_desktop(self):
-        desktops = {
-            'gnome': [
-                "gnome-app-list", "gnome-backgrounds", "gnome-calculator", "gnome-characters", "gnome-connections", "gnome-control-center",
-                "gnome-desktop",  "gnome-desktop-4", "gnome-desktop-common", "gnome-disk-utility", "gdm", "gnome-font-viewer", "gnome-keybindings",
-                "gnome-keyring", "gnome-logs", "gnome-session", "gnome-settings-daemon", "gnome-shell", "gnome-shell-extensions",
-                "gnome-shell-extension-pop-shell", "gnome-software", "gnome-system-monitor", "gnome-terminal", "gnome-themes-extra", "gnome-tweaks",
-                "xdg-desktop-portal-gnome", "nautilus"
-            ],
-            'plasma': [
-                "aurorae", "bluedevil", "breeze", "breeze-gtk", "breeze-plymouth", "discover", "drkonqi", "flatpak-kcm", "kactivitymanagerd",
-                "kde-cli-tools", "kde-gtk-config", "kdecoration", "kdeplasma-addons", "kgamma", "kglobalacceld", "kinfocenter", "kmenuedit",
-                "kpipewire", "krdp", "kscreen", "kscreenlocker", "ksshaskpass", "ksystemstats", "kwayland", "kwin", "kwin-x11", "kwrited",
-                "layer-shell-qt", "libkscreen", "libksysguard", "libplasma", "milou", "ocean-sound-theme", "oxygen", "oxygen-sounds",
-                "plasma-activities", "plasma-activities-stats", "plasma-browser-integration", "plasma-desktop", "plasma-disks", "plasma-firewall",
-                "plasma-integration", "plasma-nm", "plasma-pa", "plasma-sdk", "plasma-systemmonitor", "plasma-thunderbolt", "plasma-vault",
-                "plasma-workspace", "plasma-workspace-wallpapers", "plasma5support", "plymouth-kcm", "polkit-kde-agent", "powerdevil",
-                "print-manager", "qqc2-breeze-style", "sddm", "sddm-kcm", "spectacle", "systemsettings", "xdg-desktop-portal-kde"
-            ],
-            'mate': [
-                "caja", "marco", "mate-backgrounds", "mate-control-center", "mate-desktop", "mate-icon-theme", "mate-menus", "mate-panel",
-                "mate-notification-daemon", "mate-polkit", "mate-session-manager", "mate-settings-daemon", "mate-themes", "mate-user-guide"
-            ],
-            'hypr': [
-                "hyprland", "waybar", "rofi", "hyprpaper", "sddm", "hyprcursor", "hyprgraphics", "hypridle", "hyprland-qt-support", "hyprland-qtutils",
-                "hyprlang", "hyprlock", "hyprshot", "hyprutils"
-            ]
-        }
-        others = [
-            "firefox", "git", "htop", "btop", "7zip", "adwaita-cursors", "adwaita-fonts", "adwaita-icon-theme", "adwaita-icon-theme-legacy", "amd-ucode", "ark",
-            "audacity", "base-devel", "blender", "bzip2", "clang", "cmake", "cmatrix", "curl", "dav1d", "dconf", "ddrescue", "discord", "dosbox", "exfatprogs",
-            "ffmpeg", "filezilla", "firefox", "flatpak", "fluidsynth", "gcc",  "gimp", "git", "glad", "glew", "glfw", "glibc", "glm", "go", "gparted", "gradle",
-            "grep", "gtk2", "gtk3", "gtk4", "gzip", "heimdall", "hexedit", "hwinfo", "imagemagick", "imath", "inkscape", "jdk-openjdk", "kdenlive", "kitty",
-            "less", "lm_sensors", "lua", "mousepad", "nano", "nasm", "ninja", "openal", "openssh", "parted", "pavucontrol", "pipewire", "pipewire-audio", "python",
-            "python-numpy", "python-opengl", "python-pillow", "python-pip", "python-pyqt6", "qt5", "qt5ct", "qt6", "qt6ct", "sdl2_image", "sdl2_mixer", "sdl2_ttf",
-            "sdl3", "steam", "thunar", "ttf-fira-code", "ttf-firacode-nerd", "unzip", "vlc", "wacomtablet", "wget", "wine", "wl-clipboard", "woff2", "zsh",
-            "zsh-autosuggestions", "zsh-completions", "zsh-syntax-highlighting"
-        ]
-        if self.sett['de'] not in desktops.keys():
-            raise ValueError("Wrong desktop environment. Choose from 'gnome', 'plasma', 'mate' and 'hypr'.")
+        self.prefetch_packages()
+        self.app.logger.log(f"  Waiting for package downloads...")
+        self.prefetch.join()
+        if self.prefetch_error is not None:
+            raise self.prefetch_error
 
-        self.app.logger.log(f"  Installing desktop environment...")
-        self.crexe(f"pacman -Syu --noconfirm {' '.join(desktops[self.sett['de']])}")
-        self.app.logger.log(f"  Installing other packages...")
-        self.crexe(f"pacman -Syu --noconfirm {' '.join(others)}")
+        # Databases were synced by the download step, so no second -y here
+        self.app.logger.log(f"  Installing desktop environment and other packages...")
+        self.crexe(f"pacman -Su --noconfirm --needed {' '.join(self.packages())}")
 
     def config_paru(self):
-        self.app.logger.log(f"  Downloading paru...")
-        self.crexe("mkdir -p /tmp/paru")
-        self.crexe("git clone https://aur.archlinux.org/paru.git /tmp/paru")
-        self.crexe("cd /tmp/paru")
+        self.app.logger.log(f"  Fetching AUR packages...")
+        srcinfos, keys = self.fetch_aur(["paru"] + self.aur)
+        graph = build_graph(srcinfos)
+        pkgbases = build_order(graph)
+        keys = chain_keys(keys, graph, pkgbases)
+
+        cached = {pkgbase: self.aur_cache.lookup(keys[pkgbase]) for pkgbase in pkgbases}
+        todo = [pkgbase for pkgbase in pkgbases if cached[pkgbase] is None]
+        for pkgbase in pkgbases:
+            if pkgbase not in todo:
+                self.app.logger.log(f"  Using cached build of {pkgbase}.")
+        built = self.build_aur(todo, graph, srcinfos, keys, cached) if todo else {}
+
+        # Cached and freshly built packages go in with one transaction
+        pkgs = []
+        for pkgbase in pkgbases:
+            pkgs += built.get(pkgbase) or cached[pkgbase] or []
+        pkgs = installable(pkgs)
+        if pkgs:
+            self.app.logger.log(f"  Installing AUR packages...")
+            self.crexe(f"pacman -U --noconfirm --needed {' '.join(self.target_paths(pkgs))}")
+        shutil.rmtree(f"{self.root}{AUR_STAGE}", ignore_errors=True)
+
+        # Without a configured cache it only lived for this install
+        if not self.sett.get('aur_cache'):
+            shutil.rmtree(self.aur_cache.path, ignore_errors=True)
+
+    def fetch_aur(self, pkgbases: list[str]):
+        """Clone (or pull) the packages and the AUR packages they depend on.
+
+        Returns the .SRCINFO and build key of every package base.
+        """
+        step = self.step
+        # A dependency the target's sync databases don't have has to come from the AUR
+        index = load_index(f"{self.root}/var/lib/pacman/sync", f"{self.root}/etc/pacman.conf")
+
+        def fetch(pkgbase):
+            self.step = step
+            src = self.aur_cache.source_dir(pkgbase)
+            if os.path.isdir(f"{src}/.git"):
+                self.run(["git", "-C", src, "pull", "-q", "--ff-only"])
+            else:
+                os.makedirs(os.path.dirname(src), exist_ok=True)
+                self.run(["git", "clone", "-q", "--depth", "1", f"{AUR_URL}/{pkgbase}.git", src])
+            return read_srcinfo(f"{src}/.SRCINFO")
+
+        srcinfos, keys = {}, {}
+        # Mostly waiting on the network
+        with ThreadPoolExecutor(max_workers=AUR_FETCH_JOBS) as pool:
+            while pkgbases:
+                for pkgbase, srcinfo in zip(pkgbases, pool.map(fetch, pkgbases)):
+                    src = self.aur_cache.source_dir(pkgbase)
+                    # The AUR hands out an empty repository for names it doesn't know
+                    if os.path.isdir(src) and not srcinfo:
+                        raise RuntimeError(f"'{pkgbase}' is not in the AUR")
+                    srcinfos[pkgbase] = srcinfo
+                    keys[pkgbase] = build_key(git_head(src), srcinfo, index)
+                if index is None:
+                    break
+                provided = {name for pkgbase, srcinfo in srcinfos.items() for name in [pkgbase] + provided_names(srcinfo)}
+                deps = [dep for srcinfo in srcinfos.values() for dep in repo_depends(srcinfo)]
+                pkgbases = [dep for dep in dict.fromkeys(deps) if dep not in provided and index.lookup(dep) is None]
+        return srcinfos, keys
+
+    def build_aur(self, todo: list[str], graph: dict, srcinfos: dict, keys: dict, cached: dict):
+        """Build `todo` with makepkg in the target, independent packages side by side.
+
+        Each package builds in its own directory as the unprivileged builder
+        user. One that others need is installed as soon as it's built, and
+        every result is stored in the cache.
+        """
+        jobs = self.sett.get('aur_jobs') or build_jobs()
+        flags = makeflags(jobs)
+        self.app.logger.log(f"  Building {len(todo)} AUR package(s), {jobs} at a time (MAKEFLAGS={flags})...")
 
         # Create temporary user for the build
         self.app.logger.log(f"  Creating temporary user (for safety)...")
-        subprocess.run(["useradd", "-M", "-N", "-R", self.root, "-s", "/usr/bin/bash", "builder"])
-        self.app.logger.log(f"  Installing paru...")
-        self.crexe("runuser -l builder -c 'cd /tmp/paru && makepkg -si --noconfirm --needed'")
-        self.crexe("cd /")
-        self.crexe("rm -rf /tmp/paru")
-
-        self.app.logger.log(f"  Installing AUR apps...")
-        paru_apps = [
-            "minecraft-launcher", "f3", "freeimage", "heroic-games-launcher", "minecraft-launcher",
-            "multimc-bin", "nbtexplorer-bin", "neofetch", "visual-studio-code-bin", "wl-screenrec"
-        ]
-        self.crexe(f"runuser -l builder -c 'paru -S --noconfirm --needed {"".join(paru_apps)}'")
-
-        # Delete temporary user
-        self.app.logger.log(f"  Removing temporary user...")
-        subprocess.run(["userdel", "-f", "-r", "-R", self.root])
+        self.run(["useradd", "-M", "-N", "-R", self.root, "-s", "/usr/bin/bash", "builder"], check=False)
+        try:
+            for pkgbase in todo:
+                src = self.aur_cache.source_dir(pkgbase)
+                shutil.rmtree(f"{self.root}{AUR_STAGE}/{pkgbase}", ignore_errors=True)
+                if os.path.isdir(src):
+                    shutil.copytree(src, f"{self.root}{AUR_STAGE}/{pkgbase}", ignore=shutil.ignore_patterns(".git"))
+
+            # The builder can't use sudo, so makepkg gets the repo dependencies ready-made
+            aur_names = {name for pkgbase, srcinfo in srcinfos.items() for name in [pkgbase] + provided_names(srcinfo)}
+            deps = [dep for pkgbase in todo for dep in repo_depends(srcinfos[pkgbase]) if dep not in aur_names]
+            dirs = [f"{AUR_STAGE}/{where}/{pkgbase}" for pkgbase in todo for where in ("out", "home")]
+            cmds = [f"mkdir -p {' '.join(dirs)}", f"chown -R builder {AUR_STAGE}"]
+            if deps:
+                cmds.insert(0, f"pacman -S --noconfirm --needed --asdeps {' '.join(dict.fromkeys(deps))}")
+            # Cached AUR packages the builds depend on
+            needed = {dep for pkgbase in todo for dep in graph[pkgbase]}
+            prebuilt = installable([path for pkgbase in needed if cached.get(pkgbase) for path in cached[pkgbase]])
+            if prebuilt:
+                cmds.append(f"pacman -U --noconfirm --needed {' '.join(self.target_paths(prebuilt))}")
+            self.crexe_batch(cmds)
+
+            built = {}
+            pacman = threading.Lock()
+            step = self.step
+
+            def build(pkgbase):
+                self.step = step
+                self.app.logger.log(f"  Building {pkgbase}...")
+                self.crexe(
+                    f"runuser -u builder -- env -C {AUR_STAGE}/{pkgbase} HOME={AUR_STAGE}/home/{pkgbase} "
+                    f"PKGDEST={AUR_STAGE}/out/{pkgbase} MAKEFLAGS={flags} makepkg --noconfirm --nocheck"
+                )
+                files = sorted(glob.glob(f"{self.root}{AUR_STAGE}/out/{pkgbase}/*.pkg.tar.*"))
+                if files and keys[pkgbase] is not None:
+                    files = self.aur_cache.store(keys[pkgbase], files, self.run)
+                built[pkgbase] = files
+                if pkgbase in needed and installable(files):
+                    # pacman holds a lock on its database, one install at a time
+                    with pacman:
+                        self.crexe(f"pacman -U --noconfirm --needed {' '.join(self.target_paths(installable(files)))}")
+
+            # A failed build cancels the ones that need it, the others carry on
+            scheduler = Scheduler(jobs)
+            for pkgbase in todo:
+                scheduler.add(pkgbase, lambda pkgbase=pkgbase: build(pkgbase), [dep for dep in graph[pkgbase] if dep in todo])
+            scheduler.run()
+            return built
+        finally:
+            # Delete temporary user
+            self.app.logger.log(f"  Removing temporary user...")
+            self.run(["userdel", "-f", "-r", "-R", self.root, "builder"], check=False)
+
+    def target_paths(self, paths: list[str]):
+        """Paths of package files as seen from inside the target, copying in the ones on the host."""
+        os.makedirs(f"{self.root}{AUR_STAGE}/pkgs", exist_ok=True)
+        names = []
+        for path in paths:
+            if not path.startswith(f"{self.root}/"):
+                path = shutil.copy2(path, f"{self.root}{AUR_STAGE}/pkgs/")
+            names.append(path[len(self.root):])
+        return names
 
     def unmount_all(self):
-        subprocess.run(["sync"])
-        subprocess.run(["umount", "-R", f"{self.root}{self.sett['parts'][0]['path']}"], check=False)
-        subprocess.run(["umount", "-R", f"{self.root}{self.sett['parts'][2]['path']}"], check=False)
-        subprocess.run(["umount", "-R", f"{self.root}{self.sett['parts'][1]['path']}"], check=False)
+        # The sessions' arch-chroots hold their own mounts inside the root
+        self.session.close()
+        self.run(["sync"], check=False)
+        if self.cache is not None:
+            self.cache.unbind(self.run)
+        for _, path, _ in reversed(mount_plan(self.sett['parts'])):
+            self.run(["umount", "-R", f"{self.root}{path}"], check=False)
+
+    def output(self, line: str, step: str = None):
+        # Child-process output, tagged with the step it belongs to
+        self.app.logger.output(step or self.step, line)
+
+    def run(self, cmd: list[str], check=True, **kwargs):
+        with self.tracer.command(cmd, step=self.step, output_bytes=0) as span:
+            def on_line(line):
+                span.args['output_bytes'] += len(line) + 1
+                self.output(line)
+
+            code = self.executor.run(cmd, on_line, **kwargs)
+            span.args['exit_code'] = code
+        if check and code != 0:
+            raise subprocess.CalledProcessError(code, cmd)
+        return code
+
+    def traced(self, result):
+        # Chroot results carry their own timing; skipped batch commands never ran
+        if result.returncode != ChrootSession.SKIPPED:
+            self.tracer.record(
+                short_name(result.cmd), "command", result.start, result.duration,
+                command=command_line(result.cmd), step=self.step, exit_code=result.returncode,
+                output_bytes=len(result.output)
+            )
+        return result
 
     def crexe(self, cmd: str):
-        subprocess.run(["arch-chroot", self.root, "bash", "-c", cmd], check=True)
+        return self.traced(self.session.run(cmd, on_line=self.output)).check()
 
-    def install(self):
-        # Mount partitions
-        self.app.logger.log(f"[1/10] Mounting partitions...")
-        subprocess.run(["mkdir", "-p", self.root])
-        self.mount_part(self.sett['parts'][1]['part'], f"{self.root}{self.sett['parts'][1]['path']}")
-        subprocess.run(["mkdir", "-p", f"{self.root}/boot"])
-        subprocess.run(["mkdir", "-p", f"{self.root}/boot/efi"])
-        subprocess.run(["mkdir", "-p", f"{self.root}/home"])
-        self.mount_part(self.sett['parts'][0]['part'], f"{self.root}{self.sett['parts'][0]['path']}")
-        self.mount_part(self.sett['parts'][2]['part'], f"{self.root}{self.sett['parts'][2]['path']}")
-        subprocess.run(["mount", "--bind", "/dev", f"{self.root}/dev"])
-        subprocess.run(["mount", "--bind", "/sys", f"{self.root}/sys"])
-        subprocess.run(["mount", "--bind", "/proc", f"{self.root}/proc"])
-        subprocess.run(["mount", "--bind", "/run", f"{self.root}/run"])
-
-        # Install system
-        self.app.logger.log(f"[2/10] Installing base system...")
-        self.install_base()
-
-        self.app.logger.log(f"[3/10] Generating F-stab...")
-        self.gen_fstab()
-
-        # Configure system
-        self.app.logger.log(f"[4/10] Configuring system settings...")
-        self.sys_config()
+    def crexe_batch(self, cmds: list[str]):
+        results = [self.traced(res) for res in self.session.run_batch(cmds, on_line=self.output)]
+        for res in results:
+            res.check()
+        return results
 
-        # Bootloader setup
-        self.app.logger.log(f"[5/10] Installing bootloader...")
-        self.bootloader()
+    def write_trace(self):
+        path = self.sett.get('trace', TRACE_FILE)
+        try:
+            self.tracer.to_chrome(path)
+        except OSError:
+            path = os.path.join(tempfile.gettempdir(), os.path.basename(path))
+            self.tracer.to_chrome(path)
+        self.app.logger.log(f"Timings (trace written to {path}):")
+        for line in self.tracer.summary().splitlines():
+            self.app.logger.log(f"  {line}")
+
+    def run_phase(self, n: int, step: str, msg: str, fn):
+        # Wraps one step for the scheduler; the step name is per thread
+        total = len(self.steps())
+
+        def run():
+            self.step = step
+            self.app.logger.phase(step, "start")
+            digest = self.digests.get(step)
+            if digest is not None and self.journal.is_done(step, digest) and self.verify(step):
+                self.app.logger.log(f"[{n}/{total}] {msg} already done, skipping.")
+                if step == "users":
+                    try:
+                        self.set_passwords()
+                    finally:
+                        self.forget_users()
+            else:
+                self.app.logger.log(f"[{n}/{total}] {msg}")
+                with self.tracer.span(step):
+                    fn()
+                if digest is not None:
+                    self.journal.record(step, digest)
+            self.app.logger.phase(step, "done")
+        return run
+
+    def inputs(self, step: str):
+        # What each journaled step's result depends on; mounting and unmounting always run.
+        # A journaled format is never repeated, since that would wipe what came after it
+        return {
+            "format": [[(p['part'], p.get('fs'), p.get('options'), p.get('subvolumes')) for p in self.sett['parts']]],
+            "pacstrap": [BASE_PACKAGES],
+            "image": [self.image, os.path.getsize(self.image), os.path.getmtime(self.image)] if self.image else None,
+            "fstab": [self.sett['parts'], self.sett.get('mount_options'), self.sett.get('discard', "periodic")],
+            "config": [self.sett['location'], self.sett['hostname'], PARALLEL_DOWNLOADS],
+            "bootloader": [self.sett['uefi'], self.sett['parts'][0]],
+            # Never the passwords: the journal keeps its salt next to the digests
+            "users": [
+                [(acc['name'], acc.get('sudo', False), acc.get('groups', [])) for acc in self.accounts()],
+                self.sett.get('password_hash', "yescrypt")
+            ] if step == "users" else None,
+            "packages": [self.packages()],
+            "daemons": [],
+            "aur": [self.aur]
+        }.get(step)
+
+    def verify(self, step: str):
+        # Cheap checks that a journaled step's result is still there on disk
+        checks = {
+            "pacstrap": ["var/lib/pacman/local", "usr/bin/bash"],
+            "image": ["var/lib/pacman/local", "usr/bin/bash"],
+            "fstab": ["etc/fstab"],
+            "config": ["etc/hostname", "etc/locale.conf"],
+            "bootloader": ["boot/grub/grub.cfg"],
+            "daemons": ["etc/systemd/system/multi-user.target.wants/NetworkManager.service"],
+            "aur": ["usr/bin/paru"]
+        }
+        if step == "users":
+            # Only read here: the credentials are gone once a later step forgot them
+            checks["users"] = [f"home/{acc['name']}" for acc in self.accounts()]
+        if step == "packages":
+            local = f"{self.root}/var/lib/pacman/local"
+            installed = {entry.rsplit("-", 2)[0] for entry in os.listdir(local)} if os.path.isdir(local) else set()
+            return DESKTOPS[self.sett['de']][0] in installed
+        return all(os.path.exists(f"{self.root}/{path}") for path in checks.get(step, []))
+
+    def compute_digests(self):
+        # A step's digest covers its dependencies' digests, so changed inputs rerun everything after them
+        for _, step, _, _, deps in self.steps():
+            inputs = self.inputs(step)
+            if inputs is not None:
+                self.digests[step] = self.journal.digest(step, inputs, [self.digests.get(dep) for dep in deps])
+
+    def mount_all(self):
+        # Parents first, so /boot/efi lands on the mounted /boot and not under it
+        for dev, path, options in mount_plan(self.sett['parts']):
+            self.mount_part(dev, f"{self.root}{path}", options)
+        for api in ("dev", "sys", "proc", "run"):
+            os.makedirs(f"{self.root}/{api}", exist_ok=True)
+            self.run(["mount", "--bind", f"/{api}", f"{self.root}/{api}"])
+        if self.cache is not None:
+            self.app.logger.log(f"  Using package cache {self.cache.path}.")
+            self.cache.bind(self.root, self.run)
+
+    def configure(self):
+        self.sys_config()
+        # Multilib and parallel downloads are set up now, so start fetching packages
+        self.prefetch_packages()
 
-        # Add user
-        self.app.logger.log(f"[6/10] Creating users...")
-        self.add_users()
+    def create_users(self):
+        try:
+            self.add_users()
+        finally:
+            self.forget_users()
 
+    def forget_users(self):
         # Delete any user credentials before handling packages (especially AUR)
         self.sett['users'] = {}
+        self.hashes = {}
+
+    def steps(self):
+        # (number, name, message, function, dependencies)
+        if self.image:
+            # Every package is already in the image; only the per-machine steps are left
+            return [
+                (1, "format", "Creating filesystems...", self.format_parts, []),
+                (2, "mount", "Mounting partitions...", self.mount_all, ["format"]),
+                (3, "image", "Unpacking system image...", self.deploy_image, ["mount"]),
+                (4, "fstab", "Generating F-stab...", self.gen_fstab, ["image"]),
+                (5, "config", "Configuring system settings...", self.sys_config, ["image"]),
+                (6, "bootloader", "Installing bootloader...", self.bootloader, ["image"]),
+                (7, "users", "Creating users...", self.create_users, ["image"]),
+                (8, "daemons", "Enabling daemons...", self.enable_stuff, ["image"]),
+                (9, "unmount", "Unmounting partitions...", self.unmount_all, ["fstab", "config", "bootloader", "users", "daemons"])
+            ]
+        return [
+            (1, "format", "Creating filesystems...", self.format_parts, []),
+            (2, "mount", "Mounting partitions...", self.mount_all, ["format"]),
+            (3, "pacstrap", "Installing base system...", self.install_base, ["mount"]),
+            (4, "fstab", "Generating F-stab...", self.gen_fstab, ["pacstrap"]),
+            (5, "config", "Configuring system settings...", self.configure, ["pacstrap"]),
+            (6, "bootloader", "Installing bootloader...", self.bootloader, ["pacstrap"]),
+            (7, "users", "Creating users...", self.create_users, ["pacstrap"]),
+            (8, "packages", "Installing packages... (this might take a while)", self.install_desktop, ["config", "users"]),
+            (9, "daemons", "Enabling daemons...", self.enable_stuff, ["packages"]),
+            (10, "aur", "Installing AUR helper...", self.config_paru, ["packages"]),
+            (11, "unmount", "Unmounting partitions...", self.unmount_all, ["fstab", "bootloader", "daemons", "aur"])
+        ]
 
-        # Install desktop & apps
-        self.app.logger.log(f"[7/10] Installing packages... (this might take a while)")
-        self.install_desktop()
-
-        # Enable network and ssh
-        self.app.logger.log(f"[8/10] Enabling daemons...")
-        self.enable_stuff()
+    def install(self):
+        scheduler = Scheduler(
+            self.sett.get('jobs', DEFAULT_JOBS),
+            on_cancel=lambda step: self.app.logger.log(f"  Skipping {step}, it depends on a failed step.")
+        )
+        self.compute_digests()
+        # Needed even when the users step is skipped, see set_passwords
+        self.hash_passwords()
+        for n, step, msg, fn, deps in self.steps():
+            scheduler.add(step, self.run_phase(n, step, msg, fn), deps)
 
-        # Install AUR helper
-        self.app.logger.log(f"[9/10] Installing AUR helper...")
-        self.config_paru()
+        try:
+            scheduler.run()
+        finally:
+            self.write_trace()
 
-        # Unmount partitions
-        self.app.logger.log(f"[10/10] Unmounting partitions...")
-        self.unmount_all()
+        # Nothing left to resume
+        self.journal.remove()
 
-        self.app.logger.log(f"Installation complete!")
\ No newline at end of file
+        self.app.logger.log(f"Installation complete!")
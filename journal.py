@@ -0,0 +1,58 @@
+import threading, hashlib, json, time, os
+
+
+JOURNAL_DIR = "/var/lib/cosmicos-installer"
+
+
+class Journal:
+    """Persistent record of the install steps that already finished.
+
+    Every step is stored with a digest of its inputs. A later run with the same
+    settings can skip those steps; changed inputs (or a changed dependency)
+    give a different digest, so the step runs again. Passwords are never part
+    of the inputs; the digests are still salted per journal so they don't give
+    away the user names and other settings behind them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+        self.data.setdefault('salt', os.urandom(16).hex())
+        self.data.setdefault('steps', {})
+
+    def digest(self, *inputs):
+        blob = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256((self.data['salt'] + blob).encode()).hexdigest()
+
+    def is_done(self, step: str, digest: str):
+        with self.lock:
+            return self.data['steps'].get(step, {}).get('digest') == digest
+
+    def record(self, step: str, digest: str):
+        with self.lock:
+            self.data['steps'][step] = {'digest': digest, 'finished': time.time()}
+            self.save()
+
+    def forget(self, step: str):
+        with self.lock:
+            self.data['steps'].pop(step, None)
+            self.save()
+
+    def save(self):
+        # Written atomically and only readable by root
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,117 @@
+import json, os
+
+
+# Read straight from the data systemd's tools use, instead of spawning
+# `timedatectl list-timezones` and `localectl list-keymaps`
+ZONEINFO_DIR = "/usr/share/zoneinfo"
+TZDATA_FILE = "/usr/share/zoneinfo/tzdata.zi"
+KEYMAP_DIRS = ["/usr/share/kbd/keymaps", "/usr/lib/kbd/keymaps", "/usr/share/keymaps"]
+SUPPORTED_LOCALES = "/usr/share/i18n/SUPPORTED"
+CACHE_FILE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "cosmicos-installer", "locale-index.json"
+)
+
+FALLBACK_LOCALES = ["en_US.UTF-8", "pl_PL.UTF-8", "de_DE.UTF-8", "fr_FR.UTF-8"]
+
+
+def read_timezones():
+    zones = set()
+    if os.path.exists(TZDATA_FILE):
+        # Zones ('Z name ...') and links ('L target name'), like timedatectl
+        with open(TZDATA_FILE, "r") as f:
+            for line in f:
+                if line.startswith("Z "):
+                    zones.add(line.split()[1])
+                elif line.startswith("L "):
+                    zones.add(line.split()[2])
+    else:
+        for dirpath, dirnames, filenames in os.walk(ZONEINFO_DIR):
+            dirnames[:] = [d for d in dirnames if d not in ("posix", "right")]
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                with open(path, "rb") as f:
+                    if f.read(4) == b"TZif":
+                        zones.add(os.path.relpath(path, ZONEINFO_DIR))
+        zones.discard("localtime")
+        zones.discard("posixrules")
+    return sorted(zones)
+
+
+def read_keymaps():
+    maps = set()
+    for root in KEYMAP_DIRS:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d != "include"]
+            for name in filenames:
+                for suffix in (".map", ".map.gz", ".map.bz2", ".map.xz", ".map.zst"):
+                    if name.endswith(suffix):
+                        maps.add(name[:-len(suffix)])
+    return sorted(maps) or ["us"]
+
+
+def read_locales():
+    # Only UTF-8 locales: locale.gen is edited with '<locale> UTF-8' later on
+    try:
+        with open(SUPPORTED_LOCALES, "r") as f:
+            locales = [line.split()[0] for line in f if line.strip().endswith(" UTF-8")]
+    except OSError:
+        locales = []
+    return locales or FALLBACK_LOCALES
+
+
+def source_mtimes():
+    """Modification times of everything the index is built from (the cache key)."""
+    mtimes = {}
+    for path in (TZDATA_FILE, ZONEINFO_DIR, SUPPORTED_LOCALES):
+        if os.path.exists(path):
+            mtimes[path] = os.stat(path).st_mtime_ns
+    for root in KEYMAP_DIRS:
+        for dirpath, _, _ in os.walk(root):
+            mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+    return mtimes
+
+
+def build_index():
+    return {
+        'timezones': read_timezones(),
+        'keymaps': read_keymaps(),
+        'locales': read_locales()
+    }
+
+
+def load_index(cache_file: str = CACHE_FILE):
+    """The timezone/keymap/locale index, from the cache file while it's current."""
+    mtimes = source_mtimes()
+    try:
+        with open(cache_file, "r") as f:
+            cached = json.load(f)
+        if cached.get('mtimes') == mtimes:
+            return cached['index']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    index = build_index()
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp = f"{cache_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({'mtimes': mtimes, 'index': index}, f, separators=(",", ":"))
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass
+    return index
+
+
+def search(items: list[str], text: str, limit: int = 50):
+    """Case-insensitive matches of `text`: prefix matches (also after a '/') first, then substrings."""
+    text = text.strip().lower()
+    if not text:
+        return items[:limit]
+    prefix, inner = [], []
+    for item in items:
+        low = item.lower()
+        if low.startswith(text) or f"/{text}" in low:
+            prefix.append(item)
+        elif text in low:
+            inner.append(item)
+    return (prefix + inner)[:limit]
@@ -1,8 +1,52 @@
 import sys
-import subprocess
 from PyQt6.QtWidgets import (
-    QApplication, QWidget, QVBoxLayout, QLabel, QComboBox, QHBoxLayout
+    QApplication, QWidget, QVBoxLayout, QLabel, QComboBox, QHBoxLayout, QCompleter
 )
+from PyQt6.QtCore import Qt, QStringListModel
+
+import probe
+import localeindex
+
+
+class SearchCombo(QComboBox):
+    """Combo box you can type into; suggestions come from `localeindex.search`."""
+
+    def __init__(self):
+        super().__init__()
+        self.items = []
+        self.setEditable(True)
+        self.setInsertPolicy(QComboBox.InsertPolicy.NoInsert)
+
+        self.matches = QStringListModel(self)
+        self.search = QCompleter(self.matches, self)
+        self.search.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.search.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.search.activated.connect(self.choose)
+        self.setCompleter(self.search)
+
+        self.lineEdit().textEdited.connect(self.update_matches)
+        self.lineEdit().editingFinished.connect(self.restore)
+
+    def set_items(self, items: list[str], default: str = None):
+        self.items = items
+        self.setModel(QStringListModel(items, self))
+        # setModel() also hands the full list to the completer; take it back
+        self.search.setModel(self.matches)
+        if default in items:
+            self.setCurrentIndex(items.index(default))
+
+    def update_matches(self, text):
+        self.matches.setStringList(localeindex.search(self.items, text))
+
+    def choose(self, text):
+        self.setCurrentIndex(self.findText(text))
+
+    def restore(self):
+        # Never leave free text behind: fall back to the selected entry
+        if self.findText(self.currentText()) == -1:
+            self.setCurrentIndex(self.currentIndex())
+            self.setEditText(self.itemText(self.currentIndex()))
+
 
 class LocationSettings(QWidget):
     def __init__(self):
@@ -15,70 +59,51 @@ class LocationSettings(QWidget):
         # --- Language ---
         lang_layout = QHBoxLayout()
         lang_layout.addWidget(QLabel("Language:"))
-        self.lang_combo = QComboBox()
-        self.add_languages()
+        self.lang_combo = SearchCombo()
         lang_layout.addWidget(self.lang_combo)
         layout.addLayout(lang_layout)
 
         # --- Keyboard Layout ---
         kb_layout = QHBoxLayout()
         kb_layout.addWidget(QLabel("Keyboard Layout:"))
-        self.kb_combo = QComboBox()
-        self.add_keymaps()
+        self.kb_combo = SearchCombo()
         kb_layout.addWidget(self.kb_combo)
         layout.addLayout(kb_layout)
 
         # --- Timezone ---
         tz_layout = QHBoxLayout()
         tz_layout.addWidget(QLabel("Timezone:"))
-        self.tz_combo = QComboBox()
-        self.add_timezones()
+        self.tz_combo = SearchCombo()
         tz_layout.addWidget(self.tz_combo)
         layout.addLayout(tz_layout)
 
         layout.addStretch()
 
+        # The index is built in the background (see probe.py) and only
+        # loaded into the combos once the page is first shown
+        self.loaded = False
+
+    def showEvent(self, event):
+        if not self.loaded:
+            self.loaded = True
+            self.add_languages()
+            self.add_keymaps()
+            self.add_timezones()
+        super().showEvent(event)
+
     def add_languages(self):
-        langs = {
-            "English (US)": "en_US.UTF-8",
-            "Polish": "pl_PL.UTF-8",
-            "German": "de_DE.UTF-8",
-            "French": "fr_FR.UTF-8"
-        }
-        for name in langs:
-            self.lang_combo.addItem(name)
+        self.lang_combo.set_items(probe.get('locales')['locales'], "en_US.UTF-8")
 
     def add_keymaps(self):
-        try:
-            result = subprocess.run(
-                ["localectl", "list-keymaps"],
-                capture_output=True, text=True, check=True
-            )
-            for layout in result.stdout.splitlines():
-                self.kb_combo.addItem(layout)
-        except Exception as e:
-            print("Error loading keymaps:", e)
-            self.kb_combo.addItem("us")
+        self.kb_combo.set_items(probe.get('locales')['keymaps'], "us")
 
     def add_timezones(self):
-        """Runs 'timedatectl list-timezones' and fills the dropdown."""
-        try:
-            result = subprocess.run(
-                ["timedatectl", "list-timezones"],
-                capture_output=True, text=True, check=True
-            )
-            zones = result.stdout.splitlines()
-
-            # Add them to the dropdown
-            for zone in zones:
-                self.tz_combo.addItem(zone)
-
-        except Exception as e:
-            self.tz_combo.addItem("Error loading timezones")
-            print("Error:", e)
+        """Fills the dropdown from the zoneinfo index in one go."""
+        self.tz_combo.set_items(probe.get('locales')['timezones'], "UTC")
 
 if __name__ == "__main__":
+    probe.start()
     app = QApplication(sys.argv)
     win = LocationSettings()
     win.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    sys.exit(app.exec())
@@ -0,0 +1,44 @@
+from PyQt6.QtWidgets import QPlainTextEdit
+from PyQt6.QtCore import QTimer
+from collections import deque
+
+
+class LogView(QPlainTextEdit):
+    """Read-only log widget that stays cheap under heavy output.
+
+    Lines are queued in a bounded ring buffer and flushed into the document in
+    one batch per timer tick; the document itself keeps at most `max_lines`
+    blocks. The complete log is written to disk by the install thread (LogFile).
+    """
+
+    def __init__(self, max_lines: int = 5000, flush_ms: int = 50):
+        super().__init__()
+        self.setReadOnly(True)
+        self.setMaximumBlockCount(max_lines)
+        self.pending = deque(maxlen=max_lines)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(flush_ms)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start()
+
+    def append(self, text: str):
+        self.pending.extend(text.split("\n"))
+
+    def clear(self):
+        self.pending.clear()
+        super().clear()
+
+    def flush(self):
+        if not self.pending:
+            return
+        bar = self.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum() - 4
+
+        text = "\n".join(self.pending)
+        self.pending.clear()
+        self.appendPlainText(text)
+
+        # Only follow the output if the user hasn't scrolled up to read something
+        if at_bottom:
+            bar.setValue(bar.maximum())
@@ -1,13 +1,27 @@
+# Start enumerating keymaps, timezones and partitions before Qt is even loaded
+import probe
+probe.start()
+
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QLabel, QPushButton, QTextBrowser, QLineEdit, QCheckBox, QComboBox, QProgressBar,
     QVBoxLayout, QHBoxLayout, QStackedWidget, QMainWindow, QMessageBox
 )
 from PyQt6.QtGui import QPixmap
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
-import sys, subprocess, re
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
+import sys, subprocess, html
 
 from location import LocationSettings
-from install_system import Installer
+from install_system import Installer, BASE_PACKAGES, package_lists
+from syncdb import Preflight
+from blockdev import human_size
+from stream import LogPump, LogFile
+from logview import LogView
+from progress import Progress, format_eta
+from partitions import PartitionModel
+from validation import Validator
+from settings import valid_name, valid_pass, valid_hostname
+from profiles import load_profiles, resolve, DEFAULT_PROFILE
+from storage import FILESYSTEMS
 
 
 with open('LICENSE.txt', 'r') as f:
@@ -26,24 +40,42 @@ class InstallThread(QThread):
         self.success = False
         self.error_msg = ""
 
-        # Create dummy app-like object with logger
+        # Create dummy app-like object with logger. Everything goes through one
+        # pump, so streamed command output reaches the GUI in batches and in order.
+        # The log file gets every line first, the pump may skip some under load
         class DummyApp:
             def __init__(self, log_signal):
                 self.logger = self
-                self.log_signal = log_signal
+                self.pump = LogPump(log_signal.emit)
+                self.file = LogFile()
 
             def log(self, msg):
-                self.log_signal.emit(msg)
+                self.file.write(msg)
+                self.pump.push(msg, keep=True)
+
+            def output(self, step, line):
+                self.progress.feed(step, line)
+                self.file.write(f"    [{step}] {line}")
+                self.pump.push(f"    [{step}] {line}")
+
+            def phase(self, step, state):
+                self.progress.phase(step, state)
 
-        self.inst = Installer(DummyApp(self.log_signal), self.root, self.settings)
+        self.app = DummyApp(self.log_signal)
+        self.app.progress = self.progress = Progress()
+        self.inst = Installer(self.app, self.root, self.settings)
 
     def run(self):
+        self.app.pump.start()
         try:
             self.inst.install()
             self.success = True
         except Exception as e:
             self.error_msg = str(e)
+            self.app.file.write(f"Installation failed: {e}")
         finally:
+            self.app.pump.close()
+            self.app.file.close()
             self.done_signal.emit(self.success, self.error_msg)
 
 
@@ -94,6 +126,16 @@ class InstallerWindow(QMainWindow):
         self.home_combo = QComboBox()
         self.uefi = QCheckBox("Is system UEFI?")
 
+        # Filesystem to create on each partition (or leave it as it is). Only the
+        # root is formatted by default: the ESP may hold other systems' loaders
+        self.boot_fs, self.root_fs, self.home_fs = QComboBox(), QComboBox(), QComboBox()
+        for combo, default in ((self.boot_fs, None), (self.root_fs, "ext4"), (self.home_fs, None)):
+            combo.addItem("Don't format", None)
+            for fs in FILESYSTEMS:
+                combo.addItem(fs, fs)
+            combo.setCurrentIndex(combo.findData(default))
+            combo.setMaximumWidth(160)
+
         self.user_name = QLineEdit("")
         self.user_pass = QLineEdit("")
         self.root_pass = QLineEdit("")
@@ -102,24 +144,33 @@ class InstallerWindow(QMainWindow):
         self.root_pass_label = QLabel("Root Password")
 
         self.de = QComboBox()
+
+        # Inline errors, filled in by the validator
+        self.validator = Validator(self)
+        self.part_error = self.validator.error_label()
+        self.name_error = self.validator.error_label()
+        self.pass_error = self.validator.error_label()
+        self.root_error = self.validator.error_label()
+        self.host_error = self.validator.error_label()
         
         # Configure Widgets
         self.uefi.setStyleSheet("margin-top: 16px;")
-        self.boot_combo.currentTextChanged.connect(self.update_buttons)
-        self.root_combo.currentTextChanged.connect(self.update_buttons)
-        self.home_combo.currentTextChanged.connect(self.update_buttons)
-        self.hostname.textChanged.connect(self.update_buttons)
-        self.user_name.textChanged.connect(self.update_buttons)
-        self.user_pass.textChanged.connect(self.update_buttons)
-        self.root_pass.textChanged.connect(self.update_buttons)
-        self.uefi.checkStateChanged.connect(self.update_buttons)
-        self.root_check.checkStateChanged.connect(self.update_buttons)
         self.user_pass.setEchoMode(QLineEdit.EchoMode.Password)
         self.root_pass.setEchoMode(QLineEdit.EchoMode.Password)
         self.root_check.checkStateChanged.connect(self.update_labels)
-        self.license_check.checkStateChanged.connect(self.update_buttons)
         self.de.addItems(["GNOME", "KDE Plasma", "Mate", "Hyprland"])
 
+        # Package profiles, with the size of each (without the desktop itself)
+        self.profile = QComboBox()
+        self.profile_info = QLabel()
+        self.profile_info.setStyleSheet("color: #a0a0a0;")
+        self.profiles = load_profiles()
+        for name, profile in self.profiles.items():
+            self.profile.addItem(name.capitalize(), name)
+        self.profile.currentIndexChanged.connect(self.update_profile_info)
+        self.profile.setCurrentIndex(max(0, self.profile.findData(DEFAULT_PROFILE)))
+        self.update_profile_info()
+
         # Add pages
         self.add_page(self.welcome_page())
         self.add_page(self.license_page())
@@ -131,6 +182,9 @@ class InstallerWindow(QMainWindow):
         self.add_page(self.install_page())
         self.add_page(self.finish_page())
 
+        self.add_rules()
+        self.validator.page_changed.connect(self.validity_changed)
+        self.pages.currentChanged.connect(self.page_shown)
         self.update_buttons()
 
     # Helper to add pages
@@ -207,19 +261,24 @@ class InstallerWindow(QMainWindow):
         label2.setStyleSheet("margin-top: 16px;")
         label3.setStyleSheet("margin-top: 16px;")
 
-        for part in self.get_partitions():
-            self.root_combo.addItem(part)
-            self.boot_combo.addItem(part)
-            self.home_combo.addItem(part)
+        # One model shared by all three combos, filled when the page is first shown
+        self.part_model = PartitionModel(self)
+        self.parts_loaded = False
+        self.root_combo.setModel(self.part_model)
+        self.boot_combo.setModel(self.part_model)
+        self.home_combo.setModel(self.part_model)
 
         layout.addWidget(stage)
         layout.addWidget(gp_button)
-        layout.addWidget(label1)
-        layout.addWidget(self.boot_combo)
-        layout.addWidget(label2)
-        layout.addWidget(self.root_combo)
-        layout.addWidget(label3)
-        layout.addWidget(self.home_combo)
+        for label, combo, fs in (
+            (label1, self.boot_combo, self.boot_fs), (label2, self.root_combo, self.root_fs), (label3, self.home_combo, self.home_fs)
+        ):
+            row = QHBoxLayout()
+            row.addWidget(combo)
+            row.addWidget(fs)
+            layout.addWidget(label)
+            layout.addLayout(row)
+        layout.addWidget(self.part_error)
         layout.addStretch()
         return page
     
@@ -242,14 +301,17 @@ class InstallerWindow(QMainWindow):
         layout.addWidget(stage)
         layout.addWidget(label1)
         layout.addWidget(self.user_name)
+        layout.addWidget(self.name_error)
         layout.addWidget(label3)
         layout.addWidget(label2)
         layout.addWidget(self.user_pass)
+        layout.addWidget(self.pass_error)
         layout.addWidget(label4)
         layout.addWidget(self.sudo_check)
         layout.addWidget(self.root_check)
         layout.addWidget(self.root_pass_label)
         layout.addWidget(self.root_pass)
+        layout.addWidget(self.root_error)
         layout.addStretch()
         return page
     
@@ -267,7 +329,11 @@ class InstallerWindow(QMainWindow):
         layout.addWidget(stage)
         layout.addWidget(self.uefi)
         layout.addWidget(self.de)
+        layout.addWidget(QLabel("Package profile:"))
+        layout.addWidget(self.profile)
+        layout.addWidget(self.profile_info)
         layout.addLayout(hostname)
+        layout.addWidget(self.host_error)
         layout.addStretch()
         return page
     
@@ -278,21 +344,14 @@ class InstallerWindow(QMainWindow):
 
         stage = QLabel("<h1>Stage 5: Summary</h1>")
 
-        self.texts = {
-            'lang': f"Language: {self.location_settings.lang_combo.currentText()}",
-            'kblayout': f"Keyboard Layout: {self.location_settings.lang_combo.currentText()}",
-            'tz': f"Timezone: {self.location_settings.lang_combo.currentText()}",
-
-            'pboot': f"Boot Partition: {self.boot_combo.currentText()}",
-            'proot': f"Root Partition: {self.root_combo.currentText()}",
-            'phome': f"Home Partition: {self.home_combo.currentText()}",
-
-            'u_name': f"Username: {self.user_name.text()}",
-            'u_pass': f"User password: {'*'*len(self.user_pass.text())}",
-            'r_pass': f"Root password: " + ('Same as user password' if self.root_check.isChecked() else '*'*len(self.root_pass.text()))
-        }
+        # Filled in whenever the page is shown
+        self.summary = QLabel()
+        self.summary.setTextFormat(Qt.TextFormat.RichText)
+        self.summary.setWordWrap(True)
+        self.missing_packages = None
 
         layout.addWidget(stage)
+        layout.addWidget(self.summary)
         layout.addStretch()
         return page
 
@@ -304,9 +363,14 @@ class InstallerWindow(QMainWindow):
         stage = QLabel("<h1>Stage 6: Installation</h1>")
 
         self.progr = QProgressBar()
-        self.progr.setMaximum(0)
+        self.progr.setRange(0, 1000)
 
-        self.log_view = QTextBrowser()
+        # Polls the install thread's progress model; it's cheap and keeps the ETA ticking
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setInterval(500)
+        self.progress_timer.timeout.connect(self.update_progress)
+
+        self.log_view = LogView()
         self.log_view.setMinimumHeight(300)
         self.log_view.setStyleSheet("background-color: #101010; color: #00ff00; font-family: monospace;")
 
@@ -333,10 +397,44 @@ class InstallerWindow(QMainWindow):
         layout.addStretch()
         return page
 
+    # Validation rules, by page index. Pages without rules are always valid
+    def add_rules(self):
+        v = self.validator
+        v.add(1, [self.license_check], self.license_check.isChecked)
+
+        combos = [self.boot_combo, self.root_combo, self.home_combo]
+        v.add(
+            3, combos, lambda: len({combo.currentText() for combo in combos}) == 3,
+            "Boot, root and home must be different partitions.", self.part_error
+        )
+
+        v.add(
+            4, [self.user_name], lambda: valid_name(self.user_name.text()),
+            "Username is too short or contains invalid characters.", self.name_error
+        )
+        v.add(
+            4, [self.user_pass], lambda: valid_pass(self.user_pass.text()),
+            "Password is too short or contains invalid characters.", self.pass_error
+        )
+        v.add(
+            4, [self.root_pass, self.root_check], lambda: self.root_check.isChecked() or valid_pass(self.root_pass.text()),
+            "Root password is too short or contains invalid characters.", self.root_error
+        )
+
+        v.add(
+            5, [self.hostname], lambda: valid_hostname(self.hostname.text()),
+            "Hostname must be at least 5 characters of letters, digits, '-' and '.'.", self.host_error
+        )
+
+        # Set by update_summary; it's shown in the summary itself
+        v.add(6, [], lambda: not self.missing_packages)
+
     # Navigation logic
     def go_next(self):
         current = self.pages.currentIndex()
-        if current < len(self.page_list) - 1:
+        if current == len(self.page_list) - 1:
+            self.close()
+        elif current < len(self.page_list) - 1:
             if current == 6:
                 reply = QMessageBox.question(
                     self,
@@ -362,43 +460,13 @@ class InstallerWindow(QMainWindow):
 
     def update_buttons(self):
         i = self.pages.currentIndex()
-        next_enable = False
-        match i:
-            case 0|2|6|7|8:
-                next_enable = True
-            case 1:
-                next_enable = self.license_check.isChecked()
-
-            case 3:
-                next_enable = (
-                    self.boot_combo.currentText() != self.root_combo.currentText() and \
-                    self.boot_combo.currentText() != self.home_combo.currentText() and \
-                    self.root_combo.currentText() != self.home_combo.currentText()
-                )
-
-            case 4:
-                name_regex = r"[a-zA-Z\d\.-]+"
-                pass_regex = r"[\x20-\x7e]+"
-                user_name = self.user_name.text()
-                user_pass = self.user_pass.text()
-                root_pass = self.root_pass.text()
-                user_ok = len(user_name) >= 3 and re.fullmatch(name_regex, user_name)
-                pass_ok = len(user_pass) >= 8 and re.fullmatch(pass_regex, user_pass)
-                root_ok = (len(root_pass) >= 8 and re.fullmatch(pass_regex, root_pass)) or self.root_check.isChecked()
-                next_enable = all([user_ok, pass_ok, root_ok])
-
-            case 5:
-                next_enable = len(self.hostname.text()) >= 5
-
-        self.next_btn.setEnabled(next_enable)
+        self.next_btn.setEnabled(self.validator.valid(i))
         self.back_btn.setEnabled(len(self.page_list) - 1 > i > 0)
+        self.next_btn.setText("Finish" if i == len(self.page_list) - 1 else "Next")
 
-        if i == len(self.page_list) - 1:
-            self.next_btn.setText("Finish")
-            self.next_btn.clicked.connect(self.close)
-        else:
-            self.next_btn.setText("Next")
-    
+    def validity_changed(self, page, valid):
+        if page == self.pages.currentIndex():
+            self.next_btn.setEnabled(valid)
     
     def update_labels(self):
         i = self.pages.currentIndex()
@@ -410,31 +478,92 @@ class InstallerWindow(QMainWindow):
                 self.root_pass_label.show()
                 self.root_pass.show()
 
+    def update_profile_info(self):
+        name = self.profile.currentData()
+        packages, aur = resolve(self.profiles, name)
+        self.profile_info.setText(f"{self.profiles[name].description}\n{len(packages)} packages, {len(aur)} from the AUR")
+
+    def update_summary(self):
+        loc = self.location_settings
+        root_pass = 'Same as user password' if self.root_check.isChecked() else '*' * len(self.root_pass.text())
+        fs = lambda combo: f"format as {combo.currentData()}" if combo.currentData() else "keep its filesystem"
+        lines = [
+            f"Language: {loc.lang_combo.currentText()}",
+            f"Keyboard Layout: {loc.kb_combo.currentText()}",
+            f"Timezone: {loc.tz_combo.currentText()}",
+            "",
+            f"Boot Partition: {self.boot_combo.currentText()} - {fs(self.boot_fs)}",
+            f"Root Partition: {self.root_combo.currentText()} - {fs(self.root_fs)}",
+            f"Home Partition: {self.home_combo.currentText()} - {fs(self.home_fs)}",
+            "",
+            f"Username: {self.user_name.text()}",
+            f"User password: {'*' * len(self.user_pass.text())}",
+            f"Root password: {root_pass}",
+            "",
+            f"Desktop: {self.de.currentText()}",
+            f"Package profile: {self.profile.currentText()}",
+        ]
+
+        # Resolved against the live system's package databases, if it has any
+        pkgs, aur = package_lists(["gnome", "plasma", "mate", "hypr"][self.de.currentIndex()], self.profile.currentData())
+        self.missing_packages = None
+        problem = warning = None
+        try:
+            index = probe.get('syncdb')
+            check = Preflight(index, BASE_PACKAGES + pkgs) if index is not None else None
+        except Exception as e:
+            # A broken database must not take the window down with it
+            check = None
+            lines.append(f"Package sizes unknown (couldn't read the pacman databases: {e})")
+        else:
+            if index is None:
+                lines.append("Package sizes unknown (no pacman databases on this system)")
+        if check is not None:
+            lines.append(
+                f"{len(check.packages)} packages (+{len(aur)} from the AUR): "
+                f"{human_size(check.download)} to download, {human_size(check.installed)} installed"
+            )
+            self.missing_packages = check.missing
+            problem = check.problem()
+            warning = check.warning()
+
+        text = "<br>".join(html.escape(line) for line in lines)
+        if problem:
+            text += f"<br><span style='color: #e05050;'>{html.escape(problem)}</span>"
+        if warning:
+            text += f"<br><span style='color: #d09020;'>{html.escape(warning)}</span>"
+        self.summary.setText(text)
+        self.validator.recheck(6)
+
+    def page_shown(self, i):
+        # Read the package databases while the desktop and profile are picked
+        if i == 5:
+            probe.start('syncdb')
+        if i == 6:
+            self.update_summary()
+        self.update_buttons()
+        if i == 3 and not self.parts_loaded:
+            self.parts_loaded = True
+            self.load_partitions()
+
     def open_gparted(self):
         subprocess.run(["gparted"])
+        # The watcher only sees udev's changes; gparted may have changed labels or mounts too
+        self.part_model.update(full=True)
 
-    def get_partitions(self):
-        result = subprocess.run(
-            ["lsblk", "-rno", "NAME,SIZE,TYPE,MOUNTPOINT"],
-            capture_output=True, text=True
-        )
-        parts = []
-        for line in result.stdout.splitlines():
-            name, size, *rest = line.split()
-            if rest and rest[0] == "part":
-                parts.append(f"/dev/{name} ({size})")
-            elif len(rest) == 1 and rest[0] == "part":
-                parts.append(f"/dev/{name} ({size})")
-        return parts
+    def load_partitions(self):
+        self.part_model.load(probe.get('partitions'))
+        self.part_model.watch()
     
     def start_installation(self):
         self.log_view.clear()
-        self.progr.setMaximum(0)
+        self.progr.setValue(0)
+        self.progr.setFormat("%p%")
         settings = {
             'parts': [
-                {"path": "/boot/efi" if self.uefi.isChecked() else "/boot", "part": self.boot_combo.currentText().split()[0]},
-                {"path": "/", "part": self.root_combo.currentText().split()[0]},
-                {"path": "/home", "part": self.home_combo.currentText().split()[0]}
+                {"path": "/boot/efi" if self.uefi.isChecked() else "/boot", "part": self.boot_combo.currentText().split()[0], "fs": self.boot_fs.currentData()},
+                {"path": "/", "part": self.root_combo.currentText().split()[0], "fs": self.root_fs.currentData()},
+                {"path": "/home", "part": self.home_combo.currentText().split()[0], "fs": self.home_fs.currentData()}
             ],
             'location': {
                 'timezone': self.location_settings.tz_combo.currentText(),
@@ -448,26 +577,41 @@ class InstallerWindow(QMainWindow):
                 'root_pass': self.root_pass.text() if not self.root_check.isChecked() else self.user_pass.text()
             },
             'hostname': self.hostname.text(),
-            'de': ["gnome", "plasma", "mate", "hypr"][self.de.currentIndex()]
+            'uefi': self.uefi.isChecked(),
+            'de': ["gnome", "plasma", "mate", "hypr"][self.de.currentIndex()],
+            'profile': self.profile.currentData()
         }
 
         self.inst_thread = InstallThread("/mnt/install", settings)
         self.inst_thread.log_signal.connect(self.append_log)
         self.inst_thread.done_signal.connect(self.install_done)
         self.inst_thread.start()
+        self.progress_timer.start()
 
     def append_log(self, text):
         self.log_view.append(text)
-        self.log_view.ensureCursorVisible()
+
+    def update_progress(self):
+        progress = self.inst_thread.progress
+        self.progr.setValue(int(progress.value() * 1000))
+
+        text = f"%p% - {format_eta(progress.eta())}"
+        done, total = progress.bytes()
+        if total:
+            text += f" ({done / 2**20:.0f} of {total / 2**20:.0f} MiB)"
+        self.progr.setFormat(text)
 
     def install_done(self, success, msg):
-        self.progr.setMaximum(1)
+        self.progress_timer.stop()
         if success:
+            self.progr.setValue(1000)
+            self.progr.setFormat("%p%")
             self.log_view.append("\nInstallation complete!")
             self.pages.setCurrentIndex(self.pages.currentIndex() + 1)
         else:
             self.log_view.append(f"\nInstallation failed:\n\n----------------\nAw shit! Here we go again...\n----------------\n\n{msg}")
             self.inst_thread.inst.unmount_all()
+            self.inst_thread.app.pump.flush()
 
 
 if __name__ == "__main__":
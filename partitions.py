@@ -0,0 +1,91 @@
+from PyQt6.QtGui import QStandardItemModel, QStandardItem
+from PyQt6.QtCore import Qt, QFileSystemWatcher, QTimer
+import bisect, re, os
+
+import blockdev
+
+
+# udev rewrites these whenever a partition is added, removed or reformatted
+WATCH_DIRS = ["/dev/disk/by-id", "/dev/disk/by-uuid", "/dev/disk/by-partuuid", "/dev"]
+
+
+def sort_key(name: str):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+class PartitionModel(QStandardItemModel):
+    """Partitions shared by the boot/root/home combos, kept up to date in place.
+
+    When udev touches /dev/disk, only partitions that appeared, disappeared,
+    got a new filesystem UUID or changed size are looked up again; the other
+    rows (and the combos' selections) are left alone.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.devices = {}
+        self.names = []
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.schedule_update)
+
+        # udev creates several links per change; handle them in one go
+        self.debounce = QTimer(self)
+        self.debounce.setSingleShot(True)
+        self.debounce.setInterval(300)
+        self.debounce.timeout.connect(self.update)
+
+    def load(self, devices: dict):
+        self.clear()
+        self.devices, self.names = {}, []
+        for name in sorted(devices, key=sort_key):
+            self.insert(devices[name])
+
+    def watch(self):
+        paths = [path for path in WATCH_DIRS if os.path.isdir(path)]
+        if paths:
+            self.watcher.addPaths(paths)
+
+    def schedule_update(self, _path=None):
+        self.debounce.start()
+
+    def item_for(self, dev: blockdev.BlockDevice):
+        item = QStandardItem(dev.label())
+        item.setData(dev.path, Qt.ItemDataRole.UserRole)
+        return item
+
+    def insert(self, dev: blockdev.BlockDevice):
+        keys = [sort_key(name) for name in self.names]
+        row = bisect.bisect(keys, sort_key(dev.name))
+        self.names.insert(row, dev.name)
+        self.devices[dev.name] = dev
+        self.insertRow(row, self.item_for(dev))
+
+    def remove(self, name: str):
+        row = self.names.index(name)
+        del self.names[row]
+        del self.devices[name]
+        self.removeRow(row)
+
+    def update(self, full=False):
+        # `full` looks up every partition again, for changes sysfs and udev don't show
+        names = blockdev.partition_names()
+        known = set(self.devices)
+        if full:
+            changed = names & known
+        else:
+            uuids = blockdev.uuid_map()
+            sizes = blockdev.size_map(names & known)
+            changed = {
+                name for name in names & known
+                if uuids.get(name) != self.devices[name].uuid or sizes.get(name) != self.devices[name].size
+            }
+
+        for name in known - names:
+            self.remove(name)
+        for name, dev in blockdev.scan((names - known) | changed).items():
+            if name not in self.devices:
+                self.insert(dev)
+            elif dev != self.devices[name]:
+                self.devices[name] = dev
+                self.setItem(self.names.index(name), self.item_for(dev))
@@ -0,0 +1,123 @@
+import subprocess, tempfile, argparse, sys, os
+
+
+PKG_SUFFIXES = (".pkg.tar.zst", ".pkg.tar.xz", ".pkg.tar.gz")
+
+
+def read_manifest(path: str):
+    """Package names from a manifest file: one per line, '#' starts a comment."""
+    pkgs = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                pkgs.extend(line.split())
+    return list(dict.fromkeys(pkgs))
+
+
+def split_pkgfile(filename: str):
+    """Split 'name-ver-rel-arch.pkg.tar.zst' into (name, 'ver-rel', arch)."""
+    for suffix in PKG_SUFFIXES:
+        if filename.endswith(suffix):
+            stem = filename[:-len(suffix)]
+            break
+    else:
+        return None
+    parts = stem.rsplit("-", 3)
+    if len(parts) != 4:
+        return None
+    name, ver, rel, arch = parts
+    return name, f"{ver}-{rel}", arch
+
+
+class PackageCache:
+    """A host-side pacman package cache shared by every install.
+
+    The directory (or a local `file://` repo) is bind-mounted over the
+    target's /var/cache/pacman/pkg, so pacstrap and pacman only download
+    packages that aren't in it yet and every later install reuses them.
+    """
+
+    def __init__(self, location: str):
+        if location.startswith("file://"):
+            location = location[len("file://"):]
+        self.path = os.path.abspath(location)
+        self.mounted = None
+
+    def bind(self, root: str, run=subprocess.run):
+        target = f"{root}/var/cache/pacman/pkg"
+        os.makedirs(self.path, exist_ok=True)
+        os.makedirs(target, exist_ok=True)
+        run(["mount", "--bind", self.path, target], check=True)
+        self.mounted = target
+
+    def unbind(self, run=subprocess.run):
+        if self.mounted is not None:
+            run(["umount", self.mounted], check=False)
+            self.mounted = None
+
+    def packages(self):
+        return [f for f in os.listdir(self.path) if split_pkgfile(f)] if os.path.isdir(self.path) else []
+
+    def seed(self, pkgs: list[str], config: str = None):
+        """Download `pkgs` and their full dependency closure into the cache.
+
+        A throwaway database path makes pacman treat nothing as installed, and
+        files already in the cache with a matching checksum are not fetched again.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with tempfile.TemporaryDirectory(prefix="cosmic-seed-") as dbpath:
+            cmd = ["pacman", "-Syw", "--noconfirm", "--cachedir", self.path, "--dbpath", dbpath, "--logfile", "/dev/null"]
+            if config:
+                cmd += ["--config", config]
+            subprocess.run(cmd + pkgs, check=True)
+
+    def prune(self, keep: int = 1):
+        """Drop all but the newest `keep` versions of every cached package."""
+        versions = {}
+        for f in self.packages():
+            name, _, arch = split_pkgfile(f)
+            versions.setdefault((name, arch), []).append(f)
+
+        removed = []
+        for files in versions.values():
+            files.sort(key=lambda f: os.path.getmtime(os.path.join(self.path, f)), reverse=True)
+            for f in files[keep:]:
+                for path in (os.path.join(self.path, f), os.path.join(self.path, f + ".sig")):
+                    if os.path.exists(path):
+                        os.remove(path)
+                removed.append(f)
+        return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the shared CosmicOS package cache.")
+    parser.add_argument("--cache", required=True, help="cache directory or file:// repo")
+    sub = parser.add_subparsers(dest="action", required=True)
+
+    seed = sub.add_parser("seed", help="pre-download packages from manifests")
+    seed.add_argument("manifest", nargs="*", help="package manifest files")
+    seed.add_argument("--de", help="also seed the installer's own package set for this desktop")
+    seed.add_argument("--profile", default="full", help="package profile used with --de (default: full)")
+    seed.add_argument("--config", help="pacman.conf to use (enable multilib there)")
+
+    prune = sub.add_parser("prune", help="remove old package versions")
+    prune.add_argument("--keep", type=int, default=1)
+
+    args = parser.parse_args()
+    cache = PackageCache(args.cache)
+
+    if args.action == "seed":
+        pkgs = []
+        for manifest in args.manifest:
+            pkgs += read_manifest(manifest)
+        if args.de:
+            from install_system import BASE_PACKAGES, DESKTOPS
+            from profiles import load_profiles, resolve
+            pkgs += BASE_PACKAGES + DESKTOPS[args.de] + resolve(load_profiles(), args.profile)[0]
+        if not pkgs:
+            sys.exit("Nothing to seed: give a manifest or --de.")
+        cache.seed(list(dict.fromkeys(pkgs)), args.config)
+    else:
+        for f in cache.prune(args.keep):
+            print(f"Removed {f}")
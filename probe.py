@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import localeindex
+import blockdev
+import syncdb
+
+
+# System enumeration used by the GUI. The probes run in the background and
+# are cached, so building the window never waits on them. Keymaps, timezones
+# and partitions start with the process; reading the sync databases is heavy
+# enough to slow down Qt's startup, so that one waits until it's asked for.
+
+PROBES = {
+    'locales': localeindex.load_index,
+    'partitions': blockdev.scan,
+    'syncdb': syncdb.load_index
+}
+
+EARLY = ('locales', 'partitions')
+
+_pool = ThreadPoolExecutor(max_workers=len(PROBES), thread_name_prefix="probe")
+_results = {}
+
+
+def start(*names: str):
+    for name in names or EARLY:
+        if name not in _results:
+            _results[name] = _pool.submit(PROBES[name])
+
+
+def refresh(name: str):
+    _results[name] = _pool.submit(PROBES[name])
+
+
+def get(name: str):
+    """Cached result of a probe; waits for it only if it's still running."""
+    if name not in _results:
+        refresh(name)
+    return _results[name].result()
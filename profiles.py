@@ -0,0 +1,50 @@
+import json, os
+
+
+# Package profiles: one JSON file each in PROFILE_DIR,
+#
+#   {"description": "...", "inherits": ["desktop"], "packages": [...], "aur": [...]}
+#
+# A profile installs its parents' packages first, then its own. Composing
+# profiles that share a parent (or list the same package) installs it once.
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "package-profiles")
+DEFAULT_PROFILE = "full"
+
+
+class Profile:
+    def __init__(self, name: str, description: str = "", inherits: list[str] = None, packages: list[str] = None, aur: list[str] = None):
+        self.name = name
+        self.description = description
+        self.inherits = inherits or []
+        self.packages = packages or []
+        self.aur = aur or []
+
+
+def load_profiles(directory: str = PROFILE_DIR):
+    profiles = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".json"):
+            name = filename[:-len(".json")]
+            with open(os.path.join(directory, filename), "r") as f:
+                data = json.load(f)
+            profiles[name] = Profile(
+                name, data.get('description', ""), data.get('inherits'), data.get('packages'), data.get('aur')
+            )
+    return profiles
+
+
+def resolve(profiles: dict, name: str, seen: tuple = ()):
+    """All (repo packages, AUR packages) of a profile, parents first, without duplicates."""
+    if name in seen:
+        raise ValueError(f"Package profiles inherit in a loop: {' -> '.join(seen + (name,))}")
+    if name not in profiles:
+        raise ValueError(f"Unknown package profile '{name}'. Choose from {', '.join(profiles)}.")
+
+    profile = profiles[name]
+    packages, aur = [], []
+    for parent in profile.inherits:
+        parent_packages, parent_aur = resolve(profiles, parent, seen + (name,))
+        packages += parent_packages
+        aur += parent_aur
+    return list(dict.fromkeys(packages + profile.packages)), list(dict.fromkeys(aur + profile.aur))
@@ -0,0 +1,114 @@
+from collections import deque
+import threading, time, re
+
+
+# Relative cost of each step, roughly its share of a typical install's wall time.
+# "download" is the background package download started after system config.
+PHASE_WEIGHTS = {
+    "format": 2, "mount": 1, "pacstrap": 15, "fstab": 1, "config": 3, "bootloader": 3, "users": 1,
+    "download": 20, "packages": 35, "daemons": 1, "aur": 18, "unmount": 1
+}
+
+SIZE_UNITS = {"B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+
+PACKAGES_RE = re.compile(r"^Packages \((\d+)\)")
+DOWNLOAD_SIZE_RE = re.compile(r"^Total Download Size:\s+([\d.]+)\s+(B|KiB|MiB|GiB)")
+DOWNLOADING_RE = re.compile(r"(^downloading \S+|\S+ downloading\.\.\.)")
+INSTALLING_RE = re.compile(r"^\(\s*(\d+)/(\d+)\) (installing|upgrading|reinstalling|downgrading) ")
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "estimating..."
+    seconds = int(seconds)
+    if seconds < 60:
+        return "less than a minute left"
+    return f"about {seconds // 60} min left" if seconds < 3600 else f"about {seconds // 3600} h {seconds % 3600 // 60} min left"
+
+
+class PacmanProgress:
+    """Progress of one pacman/pacstrap run, parsed from its (non-tty) output."""
+
+    def __init__(self):
+        self.packages = 0
+        self.download_bytes = 0
+        self.downloaded = 0
+        self.installed = 0
+
+    def feed(self, line: str):
+        line = line.strip()
+        if m := PACKAGES_RE.match(line):
+            self.packages = int(m.group(1))
+        elif m := DOWNLOAD_SIZE_RE.match(line):
+            self.download_bytes = int(float(m.group(1)) * SIZE_UNITS[m.group(2)])
+        elif DOWNLOADING_RE.search(line):
+            self.downloaded += 1
+        elif m := INSTALLING_RE.match(line):
+            self.installed, self.packages = int(m.group(1)), int(m.group(2))
+
+    def bytes_done(self):
+        if not self.packages:
+            return 0
+        # Output only names files, so spread the announced total evenly over them
+        return min(self.download_bytes, self.download_bytes * self.downloaded // self.packages)
+
+    def fraction(self, download_only=False):
+        if not self.packages:
+            return 0.0
+        dl = 1.0 if self.installed else min(1.0, self.downloaded / self.packages)
+        if download_only:
+            return dl
+        inst = self.installed / self.packages
+        return 0.5 * dl + 0.5 * inst if self.download_bytes else inst
+
+
+class Progress:
+    """Weighted install progress with a rolling ETA.
+
+    Phases are started and finished explicitly (several may run at once);
+    within pacman-driven phases the fraction comes from package and byte
+    counts in their output.
+    """
+
+    def __init__(self, weights: dict = PHASE_WEIGHTS, window: float = 90.0):
+        self.weights = dict(weights)
+        self.total = sum(self.weights.values())
+        self.window = window
+        self.fractions = {}
+        self.pacman = {}
+        self.samples = deque()
+        self.lock = threading.Lock()
+
+    def phase(self, step: str, state: str):
+        with self.lock:
+            self.fractions[step] = 1.0 if state == "done" else self.fractions.get(step, 0.0)
+
+    def feed(self, step: str, line: str):
+        if step not in ("pacstrap", "download", "packages", "aur"):
+            return
+        with self.lock:
+            parser = self.pacman.setdefault(step, PacmanProgress())
+            parser.feed(line)
+            if self.fractions.get(step, 0.0) < 1.0:
+                self.fractions[step] = max(self.fractions.get(step, 0.0), parser.fraction(step == "download"))
+
+    def value(self):
+        with self.lock:
+            done = sum(self.weights.get(step, 0) * frac for step, frac in self.fractions.items())
+        return min(1.0, done / self.total)
+
+    def bytes(self):
+        with self.lock:
+            return sum(p.bytes_done() for p in self.pacman.values()), sum(p.download_bytes for p in self.pacman.values())
+
+    def eta(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        value = self.value()
+        self.samples.append((now, value))
+        while len(self.samples) > 2 and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+        t0, v0 = self.samples[0]
+        if now - t0 < 5 or value <= v0:
+            return None
+        return (1.0 - value) * (now - t0) / (value - v0)
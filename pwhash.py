@@ -0,0 +1,203 @@
+import ctypes.util, ctypes, threading, hashlib, secrets, time
+
+
+# Password hashes in crypt(3) format, for /etc/shadow.
+#
+# yescrypt ($y$, Arch's default) only exists in libxcrypt, so it goes through
+# the host's libcrypt. SHA-512-crypt ($6$) uses libcrypt as well when it's
+# there and the pure Python implementation below otherwise. Either way the
+# cost is calibrated so one hash takes about HASH_TIME on this machine.
+
+HASH_TIME = 0.25
+
+B64 = "./0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+SHA512_DEFAULT_ROUNDS = 5000
+SHA512_MIN_ROUNDS = 1000
+SHA512_MAX_ROUNDS = 999999999
+
+# yescrypt costs are log2 of the memory/time factor; libxcrypt's default is 5.
+# Every step doubles the memory as well, so stay well below libxcrypt's 11
+YESCRYPT_DEFAULT_COST = 5
+YESCRYPT_MAX_COST = 8
+
+# Byte order of the final SHA-512-crypt encoding, 3 bytes per 4 characters
+SHA512_ORDER = [
+    (0, 21, 42), (22, 43, 1), (44, 2, 23), (3, 24, 45), (25, 46, 4), (47, 5, 26), (6, 27, 48),
+    (28, 49, 7), (50, 8, 29), (9, 30, 51), (31, 52, 10), (53, 11, 32), (12, 33, 54), (34, 55, 13),
+    (56, 14, 35), (15, 36, 57), (37, 58, 16), (59, 17, 38), (18, 39, 60), (40, 61, 19), (62, 20, 41)
+]
+
+CRYPT_DATA_SIZE = 32768
+CRYPT_GENSALT_OUTPUT_SIZE = 192
+
+
+def b64_24bit(b2: int, b1: int, b0: int, n: int):
+    w = (b2 << 16) | (b1 << 8) | b0
+    out = []
+    for _ in range(n):
+        out.append(B64[w & 0x3f])
+        w >>= 6
+    return "".join(out)
+
+
+def gen_salt(length: int = 16):
+    return "".join(secrets.choice(B64) for _ in range(length))
+
+
+def sha512_crypt(password: str, salt: str = None, rounds: int = SHA512_DEFAULT_ROUNDS):
+    """SHA-512-crypt as specified by Ulrich Drepper (glibc/libxcrypt `$6$`)."""
+    salt = (gen_salt() if salt is None else salt)[:16]
+    rounds = max(SHA512_MIN_ROUNDS, min(SHA512_MAX_ROUNDS, rounds))
+    p, s = password.encode(), salt.encode()
+
+    b = hashlib.sha512(p + s + p).digest()
+    a = hashlib.sha512(p + s)
+    n = len(p)
+    while n > 64:
+        a.update(b)
+        n -= 64
+    a.update(b[:n])
+    n = len(p)
+    while n:
+        a.update(b if n & 1 else p)
+        n >>= 1
+    a = a.digest()
+
+    dp = hashlib.sha512(p * len(p)).digest()
+    p_bytes = (dp * (len(p) // 64 + 1))[:len(p)]
+    ds = hashlib.sha512(s * (16 + a[0])).digest()
+    s_bytes = ds[:len(s)]
+
+    # What gets hashed around C repeats every 42 rounds (lcm of 2, 3 and 7)
+    cycle = []
+    for i in range(42):
+        extra = (s_bytes if i % 3 else b"") + (p_bytes if i % 7 else b"")
+        cycle.append((True, p_bytes + extra) if i & 1 else (False, extra + p_bytes))
+
+    sha512 = hashlib.sha512
+    c = a
+    for i in range(rounds):
+        before, extra = cycle[i % 42]
+        c = sha512(extra + c if before else c + extra).digest()
+
+    encoded = "".join(b64_24bit(c[i], c[j], c[k], 4) for i, j, k in SHA512_ORDER) + b64_24bit(0, 0, c[63], 2)
+    setting = f"$6$rounds={rounds}$" if rounds != SHA512_DEFAULT_ROUNDS else "$6$"
+    return f"{setting}{salt}${encoded}"
+
+
+class LibCrypt:
+    """The host's crypt(3) through ctypes."""
+
+    def __init__(self, name: str = None):
+        self.lib = ctypes.CDLL(name or ctypes.util.find_library("crypt"))
+        self.lock = threading.Lock()
+
+        # libxcrypt's reentrant variants; plain crypt() uses a static buffer
+        self.reentrant = hasattr(self.lib, "crypt_rn")
+        if self.reentrant:
+            self.lib.crypt_rn.restype = ctypes.c_char_p
+            self.lib.crypt_rn.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_int]
+        self.lib.crypt.restype = ctypes.c_char_p
+        self.lib.crypt.argtypes = [ctypes.c_char_p, ctypes.c_char_p]
+        if hasattr(self.lib, "crypt_gensalt_rn"):
+            self.lib.crypt_gensalt_rn.restype = ctypes.c_char_p
+            self.lib.crypt_gensalt_rn.argtypes = [
+                ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int
+            ]
+
+    def crypt(self, password: str, setting: str):
+        if self.reentrant:
+            data = ctypes.create_string_buffer(CRYPT_DATA_SIZE)
+            out = self.lib.crypt_rn(password.encode(), setting.encode(), data, CRYPT_DATA_SIZE)
+        else:
+            with self.lock:
+                out = self.lib.crypt(password.encode(), setting.encode())
+        # Failures are NULL or a string starting with '*'
+        if not out or out.startswith(b"*"):
+            raise ValueError(f"crypt() doesn't support the setting {setting[:4]}...")
+        return out.decode()
+
+    def gensalt(self, prefix: str, count: int):
+        if not hasattr(self.lib, "crypt_gensalt_rn"):
+            raise ValueError("libcrypt has no crypt_gensalt_rn")
+        # No random bytes given: libxcrypt reads them from the kernel itself
+        out = ctypes.create_string_buffer(CRYPT_GENSALT_OUTPUT_SIZE)
+        if not self.lib.crypt_gensalt_rn(prefix.encode(), count, None, 0, out, CRYPT_GENSALT_OUTPUT_SIZE):
+            raise ValueError(f"crypt_gensalt() doesn't support {prefix}")
+        return out.value.decode()
+
+    def supports(self, setting: str):
+        try:
+            return self.crypt("probe", setting).startswith(setting[:3])
+        except ValueError:
+            return False
+
+
+def libcrypt():
+    try:
+        return LibCrypt() if ctypes.util.find_library("crypt") else None
+    except OSError:
+        return None
+
+
+class Hasher:
+    """Hashes passwords with `scheme` ('yescrypt' or 'sha512') at a calibrated cost.
+
+    yescrypt falls back to SHA-512-crypt when the host's libcrypt can't do it.
+    """
+
+    def __init__(self, scheme: str = "yescrypt", target: float = HASH_TIME, lib=None):
+        self.lib = libcrypt() if lib is None else lib
+        if scheme == "yescrypt" and not self.has_yescrypt():
+            scheme = "sha512"
+        self.native = bool(self.lib and self.lib.supports("$6$abcdefgh$"))
+        self.scheme = scheme
+        self.target = target
+        self.cost = None
+
+    def has_yescrypt(self):
+        try:
+            return bool(self.lib) and self.lib.supports(self.lib.gensalt("$y$", YESCRYPT_DEFAULT_COST))
+        except ValueError:
+            return False
+
+    def setting(self, cost: int):
+        if self.scheme == "yescrypt":
+            return self.lib.gensalt("$y$", cost)
+        return f"$6$rounds={cost}${gen_salt()}$"
+
+    def hash_with(self, password: str, cost: int):
+        setting = self.setting(cost)
+        if self.scheme == "sha512" and not self.native:
+            return sha512_crypt(password, setting.split("$")[3], cost)
+        return self.lib.crypt(password, setting)
+
+    def time(self, cost: int):
+        start = time.perf_counter()
+        self.hash_with("calibration", cost)
+        return time.perf_counter() - start
+
+    def calibrate(self):
+        """Pick the highest cost that hashes within the target time, never below the defaults."""
+        if self.scheme == "yescrypt":
+            # Every step doubles the work
+            cost = YESCRYPT_DEFAULT_COST
+            while cost < YESCRYPT_MAX_COST and self.time(cost + 1) <= self.target:
+                cost += 1
+        else:
+            # Time enough rounds that startup costs and noise don't dominate
+            rounds = SHA512_DEFAULT_ROUNDS
+            elapsed = self.time(rounds)
+            while elapsed < self.target / 4 and rounds < SHA512_MAX_ROUNDS // 2:
+                rounds *= 2
+                elapsed = self.time(rounds)
+            cost = int(rounds * self.target / max(elapsed, 1e-6))
+            cost = max(SHA512_DEFAULT_ROUNDS, min(SHA512_MAX_ROUNDS, cost))
+        self.cost = cost
+        return cost
+
+    def hash(self, password: str):
+        if self.cost is None:
+            self.calibrate()
+        return self.hash_with(password, self.cost)
@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class StepFailed(Exception):
+    def __init__(self, failed: dict, cancelled: list[str]):
+        self.failed = failed
+        self.cancelled = cancelled
+        names = ", ".join(failed)
+        msg = f"Step(s) {names} failed: " + "; ".join(str(e) for e in failed.values())
+        if cancelled:
+            msg += f" (cancelled: {', '.join(cancelled)})"
+        super().__init__(msg)
+
+
+class Scheduler:
+    """Runs install steps as a dependency graph on a small thread pool.
+
+    A step starts as soon as all of its dependencies have finished. When one
+    fails, everything that (transitively) depends on it is cancelled, while
+    unrelated steps still run to completion.
+    """
+
+    def __init__(self, max_workers: int = 4, on_cancel=None):
+        self.max_workers = max_workers
+        self.on_cancel = on_cancel
+        self.steps = {}
+
+    def add(self, name: str, fn, deps: list[str] = ()):
+        for dep in deps:
+            if dep not in self.steps:
+                raise ValueError(f"Step '{name}' depends on unknown step '{dep}'")
+        self.steps[name] = (fn, list(deps))
+
+    def dependents(self, name: str):
+        found = []
+        for other, (_, deps) in self.steps.items():
+            if name in deps:
+                found.append(other)
+                found += self.dependents(other)
+        return found
+
+    def run(self):
+        done, failed, cancelled = set(), {}, []
+        pending = dict(self.steps)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="step") as pool:
+            while pending or running:
+                # Launch everything whose dependencies are satisfied, in declaration order
+                for name, (fn, deps) in list(pending.items()):
+                    if all(dep in done for dep in deps):
+                        running[pool.submit(fn)] = name
+                        del pending[name]
+
+                if not running:
+                    # Only steps blocked behind a failure are left
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() is None:
+                        done.add(name)
+                        continue
+
+                    failed[name] = future.exception()
+                    for dep in self.dependents(name):
+                        if dep in pending:
+                            del pending[dep]
+                            cancelled.append(dep)
+                            if self.on_cancel:
+                                self.on_cancel(dep)
+
+        if failed:
+            raise StepFailed(failed, cancelled)
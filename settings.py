@@ -0,0 +1,153 @@
+import json, re
+
+from install_system import DESKTOPS
+from profiles import load_profiles, resolve, DEFAULT_PROFILE
+from image import find_image
+from storage import FILESYSTEMS
+from fstab import DISCARD_POLICIES
+
+
+# Same rules as the account and setup pages of the GUI
+NAME_REGEX = re.compile(r"[a-zA-Z\d\.-]+")
+PASS_REGEX = re.compile(r"[\x20-\x7e]+")
+GROUP_REGEX = re.compile(r"[a-z_][a-z0-9_-]*")
+# Dot separated labels of letters, digits and inner hyphens (RFC 1123)
+HOST_REGEX = re.compile(r"[a-zA-Z\d]([a-zA-Z\d-]*[a-zA-Z\d])?(\.[a-zA-Z\d]([a-zA-Z\d-]*[a-zA-Z\d])?)*")
+
+
+def valid_name(name: str):
+    return isinstance(name, str) and len(name) >= 3 and NAME_REGEX.fullmatch(name) is not None
+
+
+def valid_hostname(hostname: str):
+    return isinstance(hostname, str) and 5 <= len(hostname) <= 253 and HOST_REGEX.fullmatch(hostname) is not None
+
+
+def valid_pass(password: str):
+    return isinstance(password, str) and len(password) >= 8 and PASS_REGEX.fullmatch(password) is not None
+
+
+def validate_storage(part: dict, where: str):
+    # Optional formatting: 'fs', extra mkfs 'options' and btrfs 'subvolumes'
+    errors = []
+    fs = part.get('fs')
+    if fs is not None and fs not in FILESYSTEMS:
+        errors.append(f"'{where}.fs' must be one of {', '.join(FILESYSTEMS)}")
+    options = part.get('options', [])
+    if not isinstance(options, list) or not all(isinstance(o, str) for o in options):
+        errors.append(f"'{where}.options' must be a list of mkfs arguments")
+    subvolumes = part.get('subvolumes')
+    if subvolumes is not None:
+        if fs != "btrfs":
+            errors.append(f"'{where}.subvolumes' needs 'fs': 'btrfs'")
+        elif not isinstance(subvolumes, dict) or not all(isinstance(p, str) and p.startswith("/") for p in subvolumes.values()):
+            errors.append(f"'{where}.subvolumes' must map subvolume names to absolute mount paths")
+        elif part['path'] not in subvolumes.values():
+            errors.append(f"'{where}.subvolumes' must mount one subvolume at {part['path']}")
+    if not isinstance(part.get('mount_options', ""), str):
+        errors.append(f"'{where}.mount_options' must be a comma separated string")
+    return errors
+
+
+def load_settings(path: str):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def validate_settings(sett: dict):
+    """Check a settings dict (the schema `start_installation` builds).
+
+    Returns a list of human-readable problems; an empty list means it's valid.
+    """
+    errors = []
+
+    parts = sett.get('parts')
+    if not isinstance(parts, list) or len(parts) != 3:
+        errors.append("'parts' must list the boot, root and home partitions")
+    else:
+        for i, name in enumerate(["boot", "root", "home"]):
+            if not isinstance(parts[i], dict) or not all(isinstance(parts[i].get(key), str) and parts[i][key] for key in ('part', 'path')):
+                errors.append(f"'parts[{i}]' ({name}) needs 'part' and 'path'")
+                continue
+            errors += validate_storage(parts[i], f"parts[{i}]")
+        devices = [p.get('part') for p in parts if isinstance(p, dict) and isinstance(p.get('part'), str)]
+        if len(set(devices)) != len(devices):
+            errors.append("boot, root and home must be different partitions")
+        elif isinstance(parts[1], dict) and parts[1].get('path') != "/":
+            errors.append("'parts[1]' must be mounted at '/'")
+
+    location = sett.get('location')
+    if not isinstance(location, dict):
+        errors.append("'location' is missing")
+    else:
+        for key in ('timezone', 'language', 'kb_layout'):
+            if not location.get(key):
+                errors.append(f"'location.{key}' is missing")
+
+    users = sett.get('users')
+    if not isinstance(users, dict):
+        errors.append("'users' is missing")
+    else:
+        # One account ('name', 'pass', 'sudo') or a list of them under 'accounts'
+        if 'accounts' in users:
+            accounts = users['accounts'] if isinstance(users['accounts'], list) else []
+            if not accounts:
+                errors.append("'users.accounts' must be a non-empty list")
+        else:
+            accounts = [users]
+
+        names = []
+        for i, acc in enumerate(accounts):
+            where = f"users.accounts[{i}]" if 'accounts' in users else "users"
+            if not isinstance(acc, dict):
+                errors.append(f"'{where}' must be an object")
+                continue
+            name = acc.get('name', "")
+            if not valid_name(name) or name == "root":
+                errors.append(f"'{where}.name' must be at least 3 characters of a-z, A-Z, 0-9, '-' and '.'")
+            names.append(name)
+            if not valid_pass(acc.get('pass', "")):
+                errors.append(f"'{where}.pass' must be at least 8 printable ASCII characters")
+            if not isinstance(acc.get('sudo', False), bool):
+                errors.append(f"'{where}.sudo' must be true or false")
+            groups = acc.get('groups', [])
+            if not isinstance(groups, list) or not all(isinstance(g, str) and GROUP_REGEX.fullmatch(g) for g in groups):
+                errors.append(f"'{where}.groups' must be a list of group names")
+        if len(set(names)) != len(names):
+            errors.append("user names must be unique")
+        if not valid_pass(users.get('root_pass', "")):
+            errors.append("'users.root_pass' must be at least 8 printable ASCII characters")
+
+    if not valid_hostname(sett.get('hostname', "")):
+        errors.append("'hostname' must be at least 5 characters of letters, digits, '-' and '.'")
+    if sett.get('de') not in DESKTOPS:
+        errors.append(f"'de' must be one of {', '.join(list(DESKTOPS))}")
+    if 'profile' in sett:
+        try:
+            resolve(load_profiles(), sett['profile'])
+        except ValueError as e:
+            errors.append(f"'profile': {e}")
+    if sett.get('image'):
+        try:
+            find_image(sett['image'], sett.get('de'), sett.get('profile', DEFAULT_PROFILE))
+        except ValueError as e:
+            errors.append(f"'image': {e}")
+    if not isinstance(sett.get('uefi'), bool):
+        errors.append("'uefi' must be true or false")
+    if sett.get('password_hash', "yescrypt") not in ("yescrypt", "sha512"):
+        errors.append("'password_hash' must be 'yescrypt' or 'sha512'")
+    if 'hash_time' in sett and (not isinstance(sett['hash_time'], (int, float)) or sett['hash_time'] <= 0):
+        errors.append("'hash_time' must be a positive number of seconds")
+    if 'aur_cache' in sett and (not isinstance(sett['aur_cache'], str) or not sett['aur_cache']):
+        errors.append("'aur_cache' must be a directory path")
+    if sett.get('discard', "periodic") not in DISCARD_POLICIES:
+        errors.append(f"'discard' must be one of {', '.join(DISCARD_POLICIES)}")
+    mount_options = sett.get('mount_options', {})
+    if not isinstance(mount_options, dict) or not all(isinstance(o, str) for o in mount_options.values()):
+        errors.append("'mount_options' must map filesystems to comma separated options")
+    if 'aur_jobs' in sett and (not isinstance(sett['aur_jobs'], int) or sett['aur_jobs'] < 1):
+        errors.append("'aur_jobs' must be a positive integer")
+    if 'jobs' in sett and (not isinstance(sett['jobs'], int) or sett['jobs'] < 1):
+        errors.append("'jobs' must be a positive integer")
+
+    return errors
@@ -0,0 +1,32 @@
+# Filesystems and mounts of the target partitions
+
+FILESYSTEMS = ("ext4", "btrfs", "xfs", "vfat")
+
+
+def mkfs_command(fs: str, dev: str, options: list[str] = ()):
+    if fs == "ext4":
+        # Lazy init leaves zeroing the inode tables and journal to the kernel after boot
+        return ["mkfs.ext4", "-F", "-E", "lazy_itable_init=1,lazy_journal_init=1", *options, dev]
+    if fs == "btrfs":
+        return ["mkfs.btrfs", "-f", *options, dev]
+    if fs == "xfs":
+        return ["mkfs.xfs", "-f", *options, dev]
+    if fs == "vfat":
+        return ["mkfs.fat", "-F", "32", *options, dev]
+    raise ValueError(f"Unknown filesystem '{fs}'. Choose from {', '.join(FILESYSTEMS)}.")
+
+
+def mount_plan(parts: list[dict]):
+    """(device, path, mount options) of every mount, parents before children.
+
+    A btrfs partition with 'subvolumes' ({"@": "/", "@log": "/var/log"}) is
+    mounted once per subvolume instead of at its 'path'.
+    """
+    mounts = []
+    for part in parts:
+        if part.get('subvolumes'):
+            for subvol, path in part['subvolumes'].items():
+                mounts.append((part['part'], path, f"subvol={subvol}"))
+        else:
+            mounts.append((part['part'], part['path'], None))
+    return sorted(mounts, key=lambda mount: len([c for c in mount[1].split("/") if c]))
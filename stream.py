@@ -0,0 +1,136 @@
+import subprocess, threading, tempfile, os
+
+
+def run_streamed(cmd: list[str], on_line, check=True, stdout=None, **kwargs):
+    """Run `cmd` and hand every line of its output to `on_line` as it arrives.
+
+    stdout and stderr are drained by their own reader threads, so a chatty
+    stderr can never stall the child. Pass a file as `stdout` to keep the real
+    output and only stream stderr.
+    """
+    proc = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE if stdout is None else stdout,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace",
+        bufsize=1,
+        **kwargs
+    )
+
+    def drain(pipe):
+        # Blank lines included, the same as a chroot session hands them on
+        for line in pipe:
+            on_line(line.rstrip("\n"))
+        pipe.close()
+
+    readers = [threading.Thread(target=drain, args=(pipe,), daemon=True) for pipe in (proc.stdout, proc.stderr) if pipe]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    code = proc.wait()
+
+    if check and code != 0:
+        raise subprocess.CalledProcessError(code, cmd)
+    return code
+
+
+class LogPump:
+    """Thread-safe line buffer that forwards batches to a slow consumer (the GUI).
+
+    Lines are joined and emitted at most every `interval` seconds. If the
+    producer outruns the consumer, older child-process lines are collapsed into
+    a single "lines skipped" note; milestone lines (`keep=True`) are never dropped.
+    """
+
+    def __init__(self, emit, interval: float = 0.1, max_pending: int = 400):
+        self.emit = emit
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, daemon=True)
+            self.thread.start()
+        return self
+
+    def push(self, line: str, keep: bool = False):
+        with self.lock:
+            self.pending.append((line, keep, 0))
+            if len(self.pending) > self.max_pending:
+                self._coalesce()
+
+    def flush(self):
+        with self.lock:
+            lines = [line for line, _, _ in self.pending]
+            self.pending = []
+        if lines:
+            self.emit("\n".join(lines))
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def _coalesce(self):
+        # Keep milestones and the newest half of the buffer, and fold everything
+        # else (including earlier notes) into one "lines skipped" note.
+        # Entries are (line, keep, lines a note stands for)
+        tail = self.max_pending // 2
+        head, recent = self.pending[:-tail], self.pending[-tail:]
+        kept, skipped = [], 0
+        for line, keep, folded in head:
+            if keep:
+                kept.append((line, keep, folded))
+            else:
+                skipped += folded or 1
+        note = [(f"    ... {skipped} lines skipped ...", False, skipped)] if skipped else []
+        self.pending = kept + note + recent
+
+    def _loop(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+
+LOG_FILE = "/var/log/cosmicos-installer.log"
+
+
+class LogFile:
+    """The complete install log on disk.
+
+    Written from the install side, before a LogPump folds anything into
+    "lines skipped", so the file keeps every line the GUI may not show.
+    """
+
+    def __init__(self, path: str = LOG_FILE):
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        # Only root can read it: it's the whole output of the install
+        opener = lambda path, flags: os.open(path, flags, 0o600)
+        try:
+            return open(self.path, "a", buffering=1, opener=opener)
+        except OSError:
+            self.path = os.path.join(tempfile.gettempdir(), os.path.basename(self.path))
+            return open(self.path, "a", buffering=1, opener=opener)
+
+    def write(self, text: str):
+        with self.lock:
+            if self.file is None:
+                self.file = self.open()
+            self.file.write(text + "\n")
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,170 @@
+import subprocess, tarfile, gzip, io, os, re
+
+
+# Offline view of the pacman sync databases (/var/lib/pacman/sync/*.db), for
+# checking package names and estimating sizes before anything is installed.
+
+SYNC_DIR = "/var/lib/pacman/sync"
+PACMAN_CONF = "/etc/pacman.conf"
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class Package:
+    def __init__(self, name: str, version: str, repo: str, filename: str, csize: int, isize: int, depends: list[str], provides: list[str]):
+        self.name = name
+        self.version = version
+        self.repo = repo
+        self.filename = filename
+        self.csize = csize
+        self.isize = isize
+        self.depends = depends
+        self.provides = provides
+
+
+def dep_name(dep: str):
+    # 'glibc>=2.38' -> 'glibc', 'libfoo.so=1-64' -> 'libfoo.so'
+    return re.split(r"[<>=]", dep, maxsplit=1)[0]
+
+
+def repo_order(conf: str = PACMAN_CONF):
+    """Repositories in the order pacman.conf lists them (which decides who wins a name)."""
+    repos = []
+    try:
+        with open(conf, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("[") and line.endswith("]") and line != "[options]":
+                    repos.append(line[1:-1])
+    except OSError:
+        pass
+    return repos
+
+
+def read_db(path: str):
+    """The raw bytes of a sync database's tar archive (gzip or zstd compressed)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(ZSTD_MAGIC):
+        # No zstd in the standard library (before 3.14), so let the tool do it
+        data = subprocess.run(["zstd", "-dcq"], input=data, stdout=subprocess.PIPE, check=True).stdout
+    elif data.startswith(GZIP_MAGIC):
+        data = gzip.decompress(data)
+    return data
+
+
+def parse_desc(text: str):
+    fields, key = {}, None
+    for line in text.split("\n"):
+        if line.startswith("%") and line.endswith("%"):
+            key = line[1:-1]
+            fields[key] = []
+        elif line and key is not None:
+            fields[key].append(line)
+    return fields
+
+
+class SyncIndex:
+    """Every package of the sync databases, plus who provides what and group members."""
+
+    def __init__(self):
+        self.packages = {}
+        self.providers = {}
+        self.groups = {}
+        self.repos = []
+
+    def add_repo(self, repo: str, data: bytes):
+        self.repos.append(repo)
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:") as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith("/desc"):
+                    continue
+                fields = parse_desc(tar.extractfile(member).read().decode("utf-8", "replace"))
+                name = fields.get('NAME', [""])[0]
+                # The first repository in pacman.conf wins
+                if not name or name in self.packages:
+                    continue
+                pkg = Package(
+                    name, fields.get('VERSION', [""])[0], repo, fields.get('FILENAME', [""])[0],
+                    int(fields.get('CSIZE', ["0"])[0]), int(fields.get('ISIZE', ["0"])[0]),
+                    [dep_name(dep) for dep in fields.get('DEPENDS', [])],
+                    [dep_name(prov) for prov in fields.get('PROVIDES', [])]
+                )
+                self.packages[name] = pkg
+                for provided in pkg.provides:
+                    self.providers.setdefault(provided, []).append(name)
+                for group in fields.get('GROUPS', []):
+                    self.groups.setdefault(group, []).append(name)
+
+    def lookup(self, name: str):
+        if name in self.packages:
+            return self.packages[name]
+        if name in self.providers:
+            return self.packages[self.providers[name][0]]
+        return None
+
+    def resolve(self, names: list[str]):
+        """The dependency closure of `names` (packages or groups) and the names nothing matched."""
+        closure, missing = {}, []
+        todo = []
+        for name in names:
+            if name in self.packages or name in self.providers:
+                todo.append(name)
+            elif name in self.groups:
+                todo += self.groups[name]
+            else:
+                missing.append(name)
+
+        while todo:
+            pkg = self.lookup(todo.pop())
+            if pkg is None or pkg.name in closure:
+                continue
+            closure[pkg.name] = pkg
+            todo += pkg.depends
+        return list(closure.values()), missing
+
+
+def load_index(sync_dir: str = SYNC_DIR, conf: str = PACMAN_CONF):
+    """Parse the host's sync databases; None if there aren't any (pacman -Sy never ran)."""
+    if not os.path.isdir(sync_dir):
+        return None
+    present = [f[:-len(".db")] for f in os.listdir(sync_dir) if f.endswith(".db")]
+    if not present:
+        return None
+    order = [repo for repo in repo_order(conf) if repo in present]
+    order += sorted(repo for repo in present if repo not in order)
+
+    index = SyncIndex()
+    for repo in order:
+        index.add_repo(repo, read_db(os.path.join(sync_dir, f"{repo}.db")))
+    return index
+
+
+class Preflight:
+    """What installing `names` would take, according to the sync databases."""
+
+    def __init__(self, index: SyncIndex, names: list[str], cached: list[str] = ()):
+        self.packages, self.missing = index.resolve(names)
+        cached = set(cached)
+        self.download = sum(pkg.csize for pkg in self.packages if pkg.filename not in cached)
+        self.installed = sum(pkg.isize for pkg in self.packages)
+        self.no_multilib = "multilib" not in index.repos
+        # Without the multilib database (the target gets multilib enabled anyway),
+        # a name we can't find may well be in it: warn instead of failing
+        self.unverified = []
+        if self.no_multilib:
+            self.unverified, self.missing = self.missing, []
+
+    def problem(self):
+        if not self.missing:
+            return None
+        return f"Not in any repository: {', '.join(self.missing)}"
+
+    def warning(self):
+        if not self.unverified:
+            return None
+        return (
+            f"Can't check {', '.join(self.unverified)}: the multilib database isn't synced on this machine "
+            f"(they may be typos or multilib packages)"
+        )
@@ -0,0 +1,80 @@
+import subprocess, os
+
+import pytest
+
+from chroot import ChrootSession, SessionPool
+
+FAKEBIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakebin")
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    # The fake arch-chroot just runs bash in the "root"
+    monkeypatch.setenv("PATH", FAKEBIN + os.pathsep + os.environ.get("PATH", ""))
+    with ChrootSession(str(tmp_path)) as session:
+        yield session
+
+
+def test_output_and_exit_status(session):
+    res = session.run("echo hello; echo oops >&2; exit 3")
+    assert res.returncode == 3
+    assert res.output == "hello\noops"
+    with pytest.raises(subprocess.CalledProcessError):
+        res.check()
+
+
+def test_output_without_newline_and_blank_lines(session):
+    lines = []
+    res = session.run("printf 'a\\n\\nb'", on_line=lines.append)
+    assert res.ok and res.output == "a\n\nb"
+    assert lines == ["a", "", "b"]
+
+
+def test_runs_in_the_root(session, tmp_path):
+    assert session.run("pwd").output == str(tmp_path)
+
+
+def test_commands_dont_share_state(session):
+    session.run("cd /; export COSMIC_TEST=1")
+    assert session.run("echo \"$COSMIC_TEST\"; pwd").output.splitlines() == ["", session.root]
+
+
+def test_command_cant_read_the_next_one(session):
+    # stdin is /dev/null, so cat doesn't eat the commands queued after it
+    results = session.run_batch(["cat", "echo after"])
+    assert [res.output for res in results] == ["", "after"]
+
+
+def test_syntax_error_only_fails_that_command(session):
+    res = session.run("echo 'unbalanced")
+    assert res.returncode != 0
+    assert session.run("echo still here").output == "still here"
+
+
+def test_marker_in_output_is_not_a_result(session):
+    # Every command gets a marker of its own
+    res = session.run("echo __cosmic_0123456789abcdef__ 0; echo next")
+    assert res.ok and res.output == "__cosmic_0123456789abcdef__ 0\nnext"
+
+
+def test_batch_skips_after_failure(session):
+    results = session.run_batch(["true", "false", "echo skipped"])
+    assert [res.returncode for res in results] == [0, 1, ChrootSession.SKIPPED]
+    assert results[2].output == ""
+    # The next batch starts over
+    assert session.run_batch(["echo again"])[0].output == "again"
+
+
+def test_batch_without_stop_on_error(session):
+    results = session.run_batch(["false", "echo ran"], stop_on_error=False)
+    assert [res.returncode for res in results] == [1, 0]
+    assert results[1].output == "ran"
+
+
+def test_pool_reuses_sessions(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", FAKEBIN + os.pathsep + os.environ.get("PATH", ""))
+    pool = SessionPool(str(tmp_path))
+    assert pool.run("echo one").output == "one"
+    assert pool.run_batch(["echo two"])[0].output == "two"
+    assert len(pool.all) == 1
+    pool.close()
@@ -0,0 +1,81 @@
+import fstab
+
+
+TARGET = "/mnt/install"
+
+MOUNTINFO = """\
+22 1 8:2 / / rw,relatime shared:1 - ext4 /dev/sda2 rw
+60 22 8:18 / /mnt/install rw,relatime shared:30 - btrfs /dev/sdb2 rw,compress=zstd:1,subvolid=256,subvol=/@
+61 60 8:18 /@home /mnt/install/home rw,relatime shared:31 - btrfs /dev/sdb2 rw,compress=zstd:1,subvolid=257,subvol=/@home
+62 60 8:17 / /mnt/install/boot rw,relatime shared:32 - vfat /dev/sdb1 rw,fmask=0022
+63 62 8:17 / /mnt/install/boot/efi rw,relatime shared:33 - vfat /dev/sdb1 rw,fmask=0022
+64 60 8:2 /var/cache/pacman/pkg /mnt/install/var/cache/pacman/pkg rw,relatime shared:1 - ext4 /dev/sda2 rw
+65 60 0:22 / /mnt/install/proc rw,nosuid shared:5 - proc proc rw
+66 60 0:5 / /mnt/install/dev rw,nosuid shared:2 - devtmpfs devtmpfs rw
+67 60 8:19 / /mnt/install/data\\040disk rw,relatime shared:34 - ext4 /dev/sdb3 rw
+68 22 8:20 / /mnt/installer rw,relatime shared:35 - ext4 /dev/sdb4 rw
+"""
+
+
+def mounts(tmp_path, text=MOUNTINFO):
+    path = tmp_path / "mountinfo"
+    path.write_text(text)
+    return fstab.target_mounts(TARGET, fstab.read_mountinfo(str(path)))
+
+
+def test_target_mounts_parents_first(tmp_path):
+    found = mounts(tmp_path)
+    assert [path for path, _ in found] == ["/", "/boot", "/data disk", "/home", "/boot/efi"]
+    assert dict(found)["/home"].root == "/@home"
+
+
+def test_target_mounts_skip_bind_and_api_mounts(tmp_path):
+    found = mounts(tmp_path)
+    paths = [path for path, _ in found]
+    # The host's package cache is a bind mount of the host root
+    assert "/var/cache/pacman/pkg" not in paths
+    assert "/proc" not in paths and "/dev" not in paths
+    # /mnt/installer only shares the target's name as a prefix
+    assert "/dev/sdb4" not in [mount.source for _, mount in found]
+
+
+def test_target_mounts_last_mount_wins(tmp_path):
+    text = MOUNTINFO + "69 62 8:21 / /mnt/install/boot rw,relatime shared:36 - ext4 /dev/sdb5 rw\n"
+    assert dict(mounts(tmp_path, text))["/boot"].source == "/dev/sdb5"
+
+
+def test_mount_options_keep_subvolume():
+    mount = fstab.Mount("/dev/sdb2", "/mnt/install/home", "btrfs", "/@home", "rw")
+    assert fstab.mount_options(mount, discard="continuous") == "rw,noatime,compress=zstd:1,space_cache=v2,subvol=/@home,discard=async"
+
+
+ENTRIES = [
+    "# /dev/sdb2", "UUID=1111\t/\tbtrfs\trw,noatime,subvol=/@\t0 0",
+    "# /dev/sdb1", "UUID=AAAA-BBBB\t/boot\tvfat\trw,noatime\t0 2",
+]
+
+
+def test_write_fstab_is_idempotent(tmp_path):
+    path = str(tmp_path / "etc" / "fstab")
+    fstab.write_fstab(path, ENTRIES)
+    first = open(path).read()
+    fstab.write_fstab(path, ENTRIES)
+    assert open(path).read() == first
+    assert first == "\n".join(ENTRIES) + "\n"
+
+
+def test_write_fstab_keeps_other_entries(tmp_path):
+    path = tmp_path / "fstab"
+    path.write_text(
+        "# Static information about the filesystems.\n"
+        "UUID=old\t/\text4\trw\t0 1\n"
+        "tmpfs /tmp tmpfs rw,nosuid 0 0\n"
+    )
+    fstab.write_fstab(str(path), ENTRIES)
+    fstab.write_fstab(str(path), ENTRIES)
+    assert path.read_text() == (
+        "# Static information about the filesystems.\n"
+        "tmpfs /tmp tmpfs rw,nosuid 0 0\n"
+        "\n" + "\n".join(ENTRIES) + "\n"
+    )
+    assert not (tmp_path / "fstab.tmp").exists()
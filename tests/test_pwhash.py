@@ -0,0 +1,35 @@
+import pytest
+
+import pwhash
+
+
+# Test vectors from Ulrich Drepper's SHA-crypt specification. The one with an
+# explicit rounds=5000 is left out: sha512_crypt takes the rounds as a number
+# and never writes a rounds= prefix for the default.
+DREPPER = [
+    ("Hello world!", "saltstring", 5000,
+     "$6$saltstring$svn8UoSVapNtMuq1ukKS4tPQd8iKwSMHWjl/O817G3uBnIFNjnQJuesI68u4OTLiBFdcbYEdFCoEOfaS35inz1"),
+    ("Hello world!", "saltstringsaltstring", 10000,
+     "$6$rounds=10000$saltstringsaltst$OW1/O6BYHV6BcXZu8QVeXbDWra3Oeqh0sbHbbMCVNSnCM/UrjmM0Dp8vOuZeHBy/YTBmSK6H9qs/y3RnOaw5v."),
+    ("a very much longer text to encrypt.  This one even stretches over morethan one line.", "anotherlongsaltstring", 1400,
+     "$6$rounds=1400$anotherlongsalts$POfYwTEok97VWcjxIiSOjiykti.o/pQs.wPvMxQ6Fm7I6IoYN3CmLs66x9t0oSwbtEW7o7UmJEiDwGqd8p4ur1"),
+    ("we have a short salt string but not a short password", "short", 77777,
+     "$6$rounds=77777$short$WuQyW2YR.hBNpjjRhpYD/ifIw05xdfeEyQoMxIXbkvr0gge1a1x3yRULJ5CCaUeOxFmtlcGZelFl5CxtgfiAc0"),
+    ("a short string", "asaltof16chars..", 123456,
+     "$6$rounds=123456$asaltof16chars..$BtCwjqMJGx5hrJhZywWvt0RLE8uZ4oPwcelCjmw2kSYu.Ec6ycULevoBK25fs2xXgMNrCzIMVcgEJAstJeonj1"),
+    ("the minimum number is still observed", "roundstoolow", 10,
+     "$6$rounds=1000$roundstoolow$kUMsbe306n21p9R.FRkW3IGn.S9NPN0x50YhH1xhLsPuWGsUSklZt58jaTfF4ZEQpyUNGc0dqbpBYYBaHHrsX."),
+]
+
+
+@pytest.mark.parametrize("password, salt, rounds, expected", DREPPER)
+def test_drepper_vectors(password, salt, rounds, expected):
+    assert pwhash.sha512_crypt(password, salt, rounds) == expected
+
+
+def test_matches_host_crypt():
+    lib = pwhash.libcrypt()
+    if lib is None or not lib.supports("$6$saltstring$"):
+        pytest.skip("no crypt(3) with SHA-512 on this host")
+    hashed = pwhash.sha512_crypt("correct horse battery staple", rounds=6000)
+    assert lib.crypt("correct horse battery staple", hashed) == hashed
@@ -0,0 +1,113 @@
+import threading, json, time, os
+
+
+def command_text(cmd):
+    return " ".join(cmd) if isinstance(cmd, list) else cmd
+
+
+def short_name(cmd: str):
+    cmd = cmd.split("\n", 1)[0]
+    return cmd if len(cmd) <= 60 else cmd[:57] + "..."
+
+
+class Span:
+    def __init__(self, name: str, cat: str, args: dict):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.tid = threading.get_ident()
+        self.start = time.monotonic()
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.monotonic()) - self.start
+
+
+class Tracer:
+    """Collects timed spans for install phases and the commands they run."""
+
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+        self.origin = time.monotonic()
+
+    def begin(self, name: str, cat: str = "phase", **args):
+        span = Span(name, cat, args)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def end(self, span: Span, **args):
+        span.end = time.monotonic()
+        span.args.update(args)
+
+    def record(self, name: str, cat: str, start: float, duration: float, **args):
+        """Add a span that was timed elsewhere (e.g. one command of a chroot batch)."""
+        span = Span(name, cat, args)
+        span.start, span.end = start, start + duration
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def span(self, name: str, cat: str = "phase", **args):
+        tracer = self
+
+        class Context:
+            def __enter__(self):
+                self.span = tracer.begin(name, cat, **args)
+                return self.span
+
+            def __exit__(self, exc_type, exc, tb):
+                if exc_type is not None:
+                    self.span.args.setdefault("error", str(exc))
+                tracer.end(self.span)
+
+        return Context()
+
+    def command(self, cmd, **args):
+        """Span for one external command; fill in exit_code/output_bytes before it ends."""
+        cmd = command_text(cmd)
+        return self.span(short_name(cmd), "command", command=cmd, **args)
+
+    def to_chrome(self, path: str):
+        """Write the spans as a Chrome trace-event file (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        with self.lock:
+            spans = list(self.spans)
+        events = [{
+            "name": s.name,
+            "cat": s.cat,
+            "ph": "X",
+            "ts": round((s.start - self.origin) * 1e6),
+            "dur": round(s.duration * 1e6),
+            "pid": pid,
+            "tid": s.tid,
+            "args": s.args
+        } for s in spans]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self):
+        """Plain-text table: every phase, then the slowest commands."""
+        with self.lock:
+            spans = list(self.spans)
+        phases = [s for s in spans if s.cat == "phase"]
+        commands = sorted((s for s in spans if s.cat == "command"), key=lambda s: s.duration, reverse=True)
+
+        lines = [f"{'Phase':<24} {'Time':>9}", "-" * 34]
+        for s in phases:
+            lines.append(f"{s.name:<24} {s.duration:>8.1f}s")
+        if phases:
+            # Wall time, not a sum: the background download overlaps other phases
+            wall = max(s.start + s.duration for s in phases) - min(s.start for s in phases)
+            lines.append(f"{'Total':<24} {wall:>8.1f}s")
+
+        if commands:
+            lines += ["", f"{'Slowest commands':<48} {'Exit':>4} {'Output':>9} {'Time':>9}", "-" * 73]
+            for s in commands[:10]:
+                lines.append(
+                    f"{s.name[:48]:<48} {s.args.get('exit_code', '?'):>4} "
+                    f"{s.args.get('output_bytes', 0):>8}B {s.duration:>8.1f}s"
+                )
+        return "\n".join(lines)
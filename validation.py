@@ -0,0 +1,104 @@
+from PyQt6.QtWidgets import QLabel, QLineEdit, QComboBox, QCheckBox
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class Rule:
+    def __init__(self, page: int, fields: list, check, message: str, label: QLabel = None):
+        self.page = page
+        self.fields = fields
+        self.check = check
+        self.message = message
+        self.label = label
+        self.ok = None
+
+
+class Validator(QObject):
+    """Per-field validation of the installer pages.
+
+    Every rule names the page it guards and the widgets it reads, and a change
+    to a widget only re-runs the rules that read it. Each page keeps the set of
+    its failing rules, so asking whether a page is valid is just a lookup.
+    """
+
+    page_changed = pyqtSignal(int, bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rules = []
+        self.by_field = {}
+        self.by_label = {}
+        self.failing = {}
+        self.touched = set()
+
+    def error_label(self):
+        label = QLabel()
+        label.setStyleSheet("color: #e05050;")
+        label.setWordWrap(True)
+        label.hide()
+        return label
+
+    def add(self, page: int, fields: list, check, message: str = "", label: QLabel = None):
+        rule = Rule(page, fields, check, message, label)
+        self.rules.append(rule)
+        self.failing.setdefault(page, set())
+        if label is not None:
+            self.by_label.setdefault(label, []).append(rule)
+        for field in fields:
+            if field not in self.by_field:
+                self.by_field[field] = []
+                self.watch(field)
+            self.by_field[field].append(rule)
+        self.evaluate(rule)
+        return rule
+
+    def watch(self, field):
+        # Connected once per widget, however many rules read it
+        if isinstance(field, QLineEdit):
+            signal = field.textChanged
+        elif isinstance(field, QComboBox):
+            signal = field.currentTextChanged
+        elif isinstance(field, QCheckBox):
+            signal = field.checkStateChanged
+        else:
+            raise TypeError(f"Can't watch {type(field).__name__}")
+        signal.connect(lambda *_: self.field_changed(field))
+
+    def field_changed(self, field):
+        self.touched.add(field)
+        for rule in self.by_field[field]:
+            self.evaluate(rule)
+            if rule.label is not None:
+                self.show_error(rule.label)
+
+    def recheck(self, page: int):
+        # For rules that depend on more than their widgets
+        for rule in self.rules:
+            if rule.page == page:
+                self.evaluate(rule)
+
+    def evaluate(self, rule: Rule):
+        ok = bool(rule.check())
+        if ok == rule.ok:
+            return
+        rule.ok = ok
+
+        failing = self.failing[rule.page]
+        was_valid = not failing
+        if ok:
+            failing.discard(rule)
+        else:
+            failing.add(rule)
+        if was_valid != (not failing):
+            self.page_changed.emit(rule.page, not failing)
+
+    def show_error(self, label: QLabel):
+        # Only complain about fields the user already got to
+        for rule in self.by_label[label]:
+            if not rule.ok and any(field in self.touched for field in rule.fields):
+                label.setText(rule.message)
+                label.show()
+                return
+        label.hide()
+
+    def valid(self, page: int):
+        return not self.failing.get(page)